@@ -0,0 +1,12 @@
+"""
+ASGI config of webhook nodes, see EventApp.settings_ingest. Pair it with
+WEBHOOK_VIEW=async.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'EventApp.settings_ingest'
+
+application = get_asgi_application()
@@ -0,0 +1,24 @@
+'''
+Settings of webhook nodes: EventApp.settings with only the hook and metrics
+URLs, and without admin, sessions, messages, staticfiles, DRF or any
+middleware, none of which the csrf-exempt hook uses. Serve with
+EventApp.wsgi_ingest or EventApp.asgi_ingest. Run migrations and the admin
+with the full settings.
+'''
+from EventApp.settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    # Attendee has a foreign key to the user model.
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+
+    'core',
+]
+
+MIDDLEWARE = []
+
+ROOT_URLCONF = 'EventApp.urls_ingest'
+
+TEMPLATES = []
+
+WSGI_APPLICATION = 'EventApp.wsgi_ingest.application'
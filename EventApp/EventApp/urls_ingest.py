@@ -0,0 +1,6 @@
+'''URLs of ingest nodes, see settings_ingest. Same paths as EventApp.urls.'''
+from django.urls import path, include
+
+urlpatterns = [
+    path('core/', include('core.urls_ingest')),
+]
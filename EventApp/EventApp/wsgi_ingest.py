@@ -0,0 +1,13 @@
+"""
+WSGI config of webhook nodes, see EventApp.settings_ingest.
+
+    gunicorn EventApp.wsgi_ingest
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'EventApp.settings_ingest'
+
+application = get_wsgi_application()
@@ -0,0 +1,119 @@
+'''
+Sync vs async webhook view under ASGI.
+
+Requests are sent to the ``EventApp.asgi`` application in process, so a sync
+view is run through ``sync_to_async`` like it is behind an ASGI server, while
+the async view writes on its bounded executor.
+
+    python benchmarks/bench_asgi.py --concurrency 16 64 256
+'''
+import argparse
+import asyncio
+import importlib
+import time
+from urllib.parse import urlencode
+
+from harness import HEADER, row, setup_django, summarize, test_database
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.core.asgi import get_asgi_application  # noqa: E402
+from django.urls import clear_url_caches, reverse  # noqa: E402
+
+from benchmarks.payloads import evand_payloads  # noqa: E402
+
+
+def use_view(view):
+    settings.WEBHOOK_VIEW = view
+    import core.urls
+    import core.urls_ingest
+    import EventApp.urls
+    importlib.reload(core.urls_ingest)
+    importlib.reload(core.urls)
+    importlib.reload(EventApp.urls)
+    clear_url_caches()
+
+
+async def asgi_post(app, path, body):
+    '''POST ``body`` to the ASGI ``app`` and return the response status.'''
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'headers': [
+            (b'host', b'localhost'),
+            (b'content-type', b'application/x-www-form-urlencoded'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = None
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+async def run(payloads, concurrency):
+    app = get_asgi_application()
+    path = reverse('webhook')
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(payload):
+        body = urlencode(payload).encode()
+        async with semaphore:
+            start = time.perf_counter()
+            status = await asgi_post(app, path, body)
+            return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(post(p) for p in payloads))
+    return summarize(results, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--requests', type=int, default=500,
+        help='Requests per view and concurrency level.')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+        default=[16, 64, 256])
+    parser.add_argument('--mode', choices=('inline', 'queue'),
+        help='Override WEBHOOK_INGEST_MODE.')
+    args = parser.parse_args()
+
+    if args.mode:
+        settings.WEBHOOK_INGEST_MODE = args.mode
+    views = ('sync', 'async')
+    payloads = evand_payloads(
+        args.requests * len(args.concurrency) * len(views))
+    chunks = iter(payloads[i::len(args.concurrency) * len(views)]
+        for i in range(len(args.concurrency) * len(views)))
+    with test_database():
+        for view in views:
+            use_view(view)
+            print(f'{view} view, {settings.WEBHOOK_INGEST_MODE} mode')
+            print(HEADER)
+            for concurrency in args.concurrency:
+                result = asyncio.run(run(next(chunks), concurrency))
+                print(row(concurrency, result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+'''
+Webhook latency under a delivery burst with and without the in-flight
+limiter of core.backpressure. Bursts are served by a local threaded WSGI
+server; without the limiter every request waits its turn for the SQLite write
+lock and the tail grows with the burst, with it the excess is answered 503
+at once and the admitted requests keep their latency.
+
+``--workers`` serves them like gunicorn's sync workers instead, processes
+answering one request at a time from a shared socket, and compares a count
+per process, which never sheds there, with the slots shared by the workers.
+
+    python benchmarks/bench_backpressure.py --concurrency 16 64
+    python benchmarks/bench_backpressure.py --max-in-flight 4 --max-queued 8
+    python benchmarks/bench_backpressure.py --workers 8 --max-in-flight 2 \
+        --max-queued 2
+'''
+import argparse
+import os
+import signal
+import tempfile
+
+from harness import HEADER, row, setup_django, test_database
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.core.servers.basehttp import WSGIServer  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from bench_webhook import QuietHandler, Runner, start_server  # noqa: E402
+from benchmarks.payloads import evand_payloads  # noqa: E402
+from core import backpressure  # noqa: E402
+from core.backpressure import InFlightLimiter, SlotLimiter  # noqa: E402
+
+
+class PreforkServer:
+    '''Sync workers: ``workers`` forked processes sharing one socket.'''
+
+    def __init__(self, workers):
+        self.server = WSGIServer(('127.0.0.1', 0), QuietHandler,
+            bind_and_activate=False)
+        # gunicorn's default backlog, where the burst waits.
+        self.server.request_queue_size = 2048
+        self.server.server_bind()
+        self.server.server_activate()
+        self.server.set_app(get_wsgi_application())
+        self.server_port = self.server.server_port
+        connections.close_all()
+        self.pids = []
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    self.server.serve_forever()
+                finally:
+                    os._exit(0)
+            self.pids.append(pid)
+
+    def shutdown(self):
+        for pid in self.pids:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+
+    def server_close(self):
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--requests', type=int, default=600,
+        help='Requests per burst.')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+        default=[16, 64])
+    parser.add_argument('--max-in-flight', type=int,
+        default=settings.WEBHOOK_MAX_IN_FLIGHT)
+    parser.add_argument('--max-queued', type=int,
+        default=settings.WEBHOOK_MAX_QUEUED)
+    parser.add_argument('--queue-timeout', type=float,
+        default=settings.WEBHOOK_QUEUE_TIMEOUT)
+    parser.add_argument('--workers', type=int, default=0,
+        help='Sync worker processes instead of a threaded server.')
+    args = parser.parse_args()
+
+    limit = f'{args.max_in_flight}+{args.max_queued}'
+    slots = tempfile.TemporaryDirectory()
+    limiters = {
+        'unlimited': InFlightLimiter(0),
+        f'limit {limit} per process': InFlightLimiter(
+            args.max_in_flight, args.max_queued, args.queue_timeout),
+    }
+    if args.workers:
+        limiters[f'limit {limit} shared'] = SlotLimiter(slots.name,
+            args.max_in_flight, args.max_queued, args.queue_timeout)
+    runs = len(limiters) * len(args.concurrency)
+    payloads = iter(evand_payloads(args.requests * runs))
+
+    with slots, test_database():
+        for name, limiter in limiters.items():
+            # Forked workers take the limiter they were started with.
+            backpressure.limiter = limiter
+            server = PreforkServer(args.workers) if args.workers \
+                else start_server()
+            try:
+                runner = Runner('server', f'http://127.0.0.1:'
+                    f'{server.server_port}{reverse("webhook")}')
+                print(name)
+                print(HEADER)
+                for concurrency in args.concurrency:
+                    burst = [next(payloads) for _ in range(args.requests)]
+                    print(row(concurrency, runner.run(burst, concurrency)))
+            finally:
+                server.shutdown()
+                server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+'''
+Throughput of the batch hook against one webhook POST per payload, through
+the Django test client, with DB queries per payload.
+
+    python benchmarks/bench_batch.py -n 2000 --batch 100 500
+'''
+import argparse
+import json
+import time
+
+from harness import setup_django, test_database
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from benchmarks.payloads import evand_payloads  # noqa: E402
+from core import catalog, dedup  # noqa: E402
+
+
+def measure(name, send, payloads):
+    queries = 0
+
+    def count(execute, *args):
+        nonlocal queries
+        queries += 1
+        return execute(*args)
+
+    # Not CaptureQueriesContext, it keeps only the last 9000 queries.
+    with connection.execute_wrapper(count):
+        start = time.perf_counter()
+        send(payloads)
+        elapsed = time.perf_counter() - start
+    print(f'{name:<24}{len(payloads) / elapsed:>12.0f}'
+        f'{queries / len(payloads):>12.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--payloads', type=int, default=2000,
+        help='Payloads per run.')
+    parser.add_argument('--batch', type=int, nargs='+', default=[100, 500])
+    args = parser.parse_args()
+
+    runs = 1 + 2 * len(args.batch)
+    payloads = iter(evand_payloads(args.payloads * runs))
+    client = Client()
+    webhook, batch = reverse('webhook'), reverse('webhook-batch')
+
+    def one_by_one(payloads):
+        for payload in payloads:
+            client.post(webhook, payload)
+
+    def batches(size, ndjson):
+        def send(payloads):
+            for i in range(0, len(payloads), size):
+                chunk = payloads[i:i + size]
+                if ndjson:
+                    client.post(batch, '\n'.join(map(json.dumps, chunk)),
+                        content_type='application/x-ndjson')
+                else:
+                    client.post(batch, chunk,
+                        content_type='application/json')
+        return send
+
+    with test_database():
+        print(f'{"":<24}{"payloads/s":>12}{"queries/p":>12}')
+        runs = [('one POST each', one_by_one)] + [
+            (f'{"ndjson" if ndjson else "json"} x{size}',
+                batches(size, ndjson))
+            for size in args.batch for ndjson in (False, True)]
+        for name, send in runs:
+            # Cold process caches for every run.
+            dedup.recent.clear()
+            catalog.types.clear()
+            measure(name, send, [next(payloads)
+                for _ in range(args.payloads)])
+
+
+if __name__ == '__main__':
+    main()
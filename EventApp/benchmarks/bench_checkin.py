@@ -0,0 +1,100 @@
+'''
+Door check-in latency: lookups by ticket_id and mobile served from the cache
+and from the indexes (cache cleared before each call), the lookup endpoint
+with a staff session and with the door token, checking in one ticket, and
+syncing batches of offline scans.
+
+    python benchmarks/bench_checkin.py --tickets 20000 -n 2000 --batch 200
+'''
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from harness import percentile, setup_django, test_database
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from benchmarks.payloads import evand_payloads  # noqa: E402
+from core import checkin  # noqa: E402
+from core.models import Ticket  # noqa: E402
+
+
+def bench(name, func, args, before=None, warm=False):
+    if warm:
+        for arg in args:
+            func(arg)
+    latencies = []
+    for arg in args:
+        if before:
+            before()
+        start = time.perf_counter()
+        func(arg)
+        latencies.append(time.perf_counter() - start)
+    print(f'{name:<24}{percentile(latencies, 50) * 1e6:>10.0f}'
+        f'{percentile(latencies, 99) * 1e6:>10.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=20000)
+    parser.add_argument('-n', '--lookups', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=200,
+        help='Offline scans per sync.')
+    args = parser.parse_args()
+
+    settings.CHECKIN_TOKEN = 'benchmark'
+    with test_database():
+        for start in range(0, args.tickets, 5000):
+            Ticket.upsert_evand(evand_payloads(
+                min(5000, args.tickets - start), start=start))
+        rng = random.Random(0)
+        tickets = list(Ticket.objects.values_list('ticket_id', 'mobile'))
+        sample = [rng.choice(tickets) for _ in range(args.lookups)]
+        ticket_ids = [ticket_id for ticket_id, _ in sample]
+        mobiles = [mobile for _, mobile in sample]
+
+        client = Client()
+        client.force_login(get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        url = reverse('checkin-lookup')
+
+        print(f'{args.tickets} tickets')
+        print(f'{"":<24}{"p50 us":>10}{"p99 us":>10}')
+        bench('ticket_id, index', checkin.get_ticket, ticket_ids,
+            before=cache.clear)
+        bench('ticket_id, cached', checkin.get_ticket, ticket_ids, warm=True)
+        bench('mobile, index', checkin.find_by_mobile, mobiles,
+            before=cache.clear)
+        bench('mobile, cached', checkin.find_by_mobile, mobiles, warm=True)
+        bench('GET, session, cached',
+            lambda ticket_id: client.get(url, {'ticket_id': ticket_id}),
+            ticket_ids, warm=True)
+        door = Client(HTTP_AUTHORIZATION=f'Bearer {settings.CHECKIN_TOKEN}')
+        bench('GET, door token, cached',
+            lambda ticket_id: door.get(url, {'ticket_id': ticket_id}),
+            ticket_ids, warm=True)
+        bench('check in', checkin.check_in, sorted(set(ticket_ids)))
+
+        # Tickets not checked in yet, each scanned at two doors.
+        unscanned = sorted({ticket_id for ticket_id, _ in tickets}
+            - set(ticket_ids))
+        now = datetime.now(timezone.utc)
+        scans = [{'ticket_id': ticket_id, 'device': device,
+            'scanned_at': (now - timedelta(seconds=rng.random() * 3600))
+            .isoformat()} for ticket_id in unscanned
+            for device in ('door-a', 'door-b')]
+        rng.shuffle(scans)
+        batches = [scans[i:i + args.batch]
+            for i in range(0, len(scans), args.batch)]
+        bench(f'sync {args.batch} scans', checkin.sync, batches[:50])
+
+
+if __name__ == '__main__':
+    main()
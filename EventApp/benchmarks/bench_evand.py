@@ -0,0 +1,59 @@
+'''
+Micro-benchmark of the Evand bracket-key parser.
+
+    python benchmarks/bench_evand.py [-n 20000]
+'''
+import argparse
+import timeit
+
+import harness  # noqa: F401
+
+from benchmarks.payloads import as_stored, evand_payloads  # noqa: E402
+from core import evand  # noqa: E402
+
+
+def flat_lookups(payload):
+    # What from_evand does today, for reference.
+    return [payload.get(key) for key in (
+        'data[ticket][data][event_id]', 'data[ticket_id]',
+        'data[ticket][data][type]', 'data[ticket][data][type]',
+        'data[ticket][data][available_count]', 'data[ticket][data][price]',
+        'data[ticket][data][description]', 'data[first_name]',
+        'data[last_name]', 'data[email]', 'data[mobile]',
+        'data[discount_id]', 'data[canceled]', 'data[created_at]',
+        'data[updated_at]',
+    )]
+
+
+def bench(name, func, payloads, repeat=5):
+    best = min(timeit.repeat(
+        lambda: [func(p) for p in payloads], number=1, repeat=repeat))
+    print(f'{name:<28} {best / len(payloads) * 1e6:8.2f} us/payload')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=20000)
+    args = parser.parse_args()
+
+    payloads = evand_payloads(args.n)
+    stored = [as_stored(p) for p in payloads]
+    print(f'{args.n} payloads, {len(payloads[0])} keys each')
+
+    bench('flat lookups', flat_lookups, payloads)
+    bench('parse (cached keys)', evand.evaluate_evand_fucking_data, payloads)
+    bench('parse stored (cached keys)',
+        evand.evaluate_evand_fucking_data, stored)
+
+    cached = evand.tokenize_key
+    evand.tokenize_key = cached.__wrapped__
+    try:
+        bench('parse (uncached keys)',
+            evand.evaluate_evand_fucking_data, payloads)
+    finally:
+        evand.tokenize_key = cached
+    print(cached.cache_info())
+
+
+if __name__ == '__main__':
+    main()
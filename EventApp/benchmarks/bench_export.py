@@ -0,0 +1,60 @@
+'''
+Ticket export throughput and peak memory as the event grows. The peak
+should stay flat since rows are streamed.
+
+    python benchmarks/bench_export.py --sizes 10000 100000
+'''
+import argparse
+import time
+import tracemalloc
+
+from harness import setup_django, test_database
+
+setup_django()
+
+from benchmarks.payloads import evand_payloads  # noqa: E402
+from core.export import event_tickets, export_response  # noqa: E402
+from core.models import Ticket  # noqa: E402
+
+
+def consume(format, jalali):
+    response = export_response(event_tickets(['30000']), format, jalali)
+    return sum(len(chunk) for chunk in response.streaming_content)
+
+
+def bench(format, jalali):
+    start = time.perf_counter()
+    size = consume(format, jalali)
+    elapsed = time.perf_counter() - start
+    # A second run for the memory, tracemalloc slows it down.
+    tracemalloc.start()
+    consume(format, jalali)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    name = format + (' jalali' if jalali else '')
+    print(f'  {name:<12} {elapsed:6.2f}s {size / elapsed / 2 ** 20:6.1f} MB/s '
+        f'peak {peak / 2 ** 20:5.1f} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+        default=[10000, 100000])
+    args = parser.parse_args()
+
+    with test_database():
+        count = 0
+        for size in args.sizes:
+            for start in range(count, size, 5000):
+                # A single event, so the export covers every ticket.
+                Ticket.upsert_evand(evand_payloads(
+                    min(5000, size - start), start=start, events=1))
+            count = size
+            print(f'{Ticket.objects.count()} tickets')
+            for format, jalali in (('csv', False), ('csv', True),
+                    ('jsonl', False)):
+                bench(format, jalali)
+
+
+if __name__ == '__main__':
+    main()
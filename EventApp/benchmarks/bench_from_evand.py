@@ -0,0 +1,79 @@
+'''
+Per-payload cost of turning an Evand payload into an unsaved Ticket, before
+and after the compiled field mapping.
+
+    python benchmarks/bench_from_evand.py [-n 20000]
+'''
+import argparse
+import timeit
+from datetime import datetime
+
+from harness import setup_django
+
+setup_django()
+
+from django.http import QueryDict  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from benchmarks.payloads import as_stored, evand_payloads  # noqa: E402
+from core.evand import evaluate_evand_fucking_data  # noqa: E402
+from core.models import Ticket  # noqa: E402
+
+
+def legacy_from_evand(self, data):
+    # Ticket.from_evand before the compiled mapping, without the save.
+    self.event_id = data.get('data[ticket][data][event_id]', None)
+    self.ticket_id = data.get('data[ticket_id]', None)
+    self.type = data.get('data[ticket][data][type]', None)
+    self.title = data.get('data[ticket][data][type]', None)
+    self.available_count = data.get('data[ticket][data][available_count]', None)
+    self.price = data.get('data[ticket][data][price]', None)
+    self.description = data.get('data[ticket][data][description]', None)
+    self.first_name = data.get('data[first_name]', None)
+    self.last_name = data.get('data[last_name]', None)
+    self.email = data.get('data[email]', None)
+    self.mobile = data.get('data[mobile]', None)
+    self.discount_id = data.get('data[discount_id]', None)
+    self.canceled = data.get('data[canceled]', None)
+
+    date_format = '%Y-%m-%dT%H:%M:%S%z'
+    date = data.get('data[created_at]', timezone.now().strftime('%Y-%m-%dT%H:%M:%S%z'))
+    self.created_at = datetime.strptime(date, date_format)
+
+    date = data.get('data[updated_at]', timezone.now().strftime('%Y-%m-%dT%H:%M:%S%z'))
+    self.updated_at = datetime.strptime(date, date_format)
+    return self
+
+
+def bench(name, func, payloads, repeat=5):
+    best = min(timeit.repeat(
+        lambda: [func(p) for p in payloads], number=1, repeat=repeat))
+    print(f'{name:<32} {best / len(payloads) * 1e6:8.2f} us/payload')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=20000)
+    args = parser.parse_args()
+
+    payloads = evand_payloads(args.n)
+    querydicts = []
+    for payload in payloads:
+        qd = QueryDict(mutable=True)
+        qd.update(payload)
+        querydicts.append(qd)
+    stored = [as_stored(p) for p in payloads]
+    nested = [evaluate_evand_fucking_data(p) for p in payloads]
+
+    bench('legacy, QueryDict',
+        lambda p: legacy_from_evand(Ticket(), p), querydicts)
+    bench('mapping, QueryDict',
+        lambda p: Ticket().from_evand(p, commit=False), querydicts)
+    bench('mapping, stored payload',
+        lambda p: Ticket().from_evand(p, commit=False), stored)
+    bench('mapping, nested payload',
+        lambda p: Ticket().from_evand(p, commit=False), nested)
+
+
+if __name__ == '__main__':
+    main()
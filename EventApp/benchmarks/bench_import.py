@@ -0,0 +1,64 @@
+'''
+import_evand throughput on a generated export, parsing in process and in
+worker processes.
+
+    python benchmarks/bench_import.py -n 50000 --format jsonl --workers 0 4
+'''
+import argparse
+import csv
+import json
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+
+from harness import setup_django, test_database
+
+setup_django()
+
+from django.core.management import call_command  # noqa: E402
+
+from benchmarks.payloads import evand_payloads  # noqa: E402
+from core.models import EventStats, Ticket  # noqa: E402
+
+
+def write_export(path, format, payloads):
+    with open(path, 'w', newline='') as f:
+        if format == 'csv':
+            writer = csv.DictWriter(f, fieldnames=list(payloads[0]))
+            writer.writeheader()
+            writer.writerows(payloads)
+        elif format == 'jsonl':
+            f.writelines(json.dumps(p) + '\n' for p in payloads)
+        else:
+            json.dump(payloads, f)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--rows', type=int, default=50000)
+    parser.add_argument('--format', choices=('csv', 'json', 'jsonl'),
+        default='csv')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 4])
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    payloads = evand_payloads(args.rows)
+    with tempfile.TemporaryDirectory() as directory, test_database():
+        path = Path(directory, f'export.{args.format}')
+        write_export(path, args.format, payloads)
+        print(f'{args.rows} rows, {path.stat().st_size / 2 ** 20:.1f} MB '
+            f'{args.format}')
+        for workers in args.workers:
+            Ticket.objects.all().delete()
+            EventStats.objects.all().delete()
+            start = time.perf_counter()
+            call_command('import_evand', str(path), workers=workers,
+                chunk_size=args.chunk_size, stdout=StringIO())
+            elapsed = time.perf_counter() - start
+            print(f'  workers={workers:<3} {elapsed:6.2f}s '
+                f'{args.rows / elapsed:8.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+'''
+Full settings vs the ingest-only profile (EventApp.settings_ingest):
+worker startup, i.e. importing the WSGI application and the URLconf, and
+the time per request through the handler and middleware.
+
+Each measurement runs in a fresh interpreter, since the settings of a
+process cannot change.
+
+    python benchmarks/bench_profile.py --repeat 5 -n 2000
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROFILES = {
+    'full': ('EventApp.settings', 'EventApp.wsgi'),
+    'ingest': ('EventApp.settings_ingest', 'EventApp.wsgi_ingest'),
+}
+
+STARTUP = '''
+import json, sys, time
+start = time.perf_counter()
+import {wsgi}
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps([time.perf_counter() - start, len(sys.modules)]))
+'''
+
+
+def child(args):
+    '''Time per request, run with the profile's DJANGO_SETTINGS_MODULE.'''
+    from harness import setup_django, test_database
+    setup_django()
+    from django.conf import settings
+    from django.test import Client
+    from django.urls import reverse
+
+    from benchmarks.payloads import evand_payloads
+
+    settings.WEBHOOK_INGEST_MODE = 'queue'
+    results = {}
+    with test_database():
+        client = Client()
+        url = reverse('webhook')
+        # Rejected before the view body runs: the handler and middleware.
+        for _ in range(100):
+            client.get(url)
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            client.get(url)
+        results['get'] = (time.perf_counter() - start) / args.requests
+        payloads = evand_payloads(args.requests)
+        start = time.perf_counter()
+        for payload in payloads:
+            client.post(url, payload)
+        results['post'] = (time.perf_counter() - start) / args.requests
+    print(json.dumps(results))
+
+
+def run(profile, code=None, args=()):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=PROFILES[profile][0])
+    env.setdefault('SECRET_KEY', 'benchmark')
+    command = [sys.executable, '-c', code] if code else \
+        [sys.executable, __file__, *args]
+    output = subprocess.run(command, env=env, check=True,
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5,
+        help='Interpreters started per profile, the median is reported.')
+    parser.add_argument('-n', '--requests', type=int, default=2000)
+    parser.add_argument('--child', action='store_true',
+        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    print(f'{"profile":<8}{"startup ms":>12}{"modules":>9}'
+        f'{"GET 405 us":>12}{"POST ms":>9}')
+    for profile, (_, wsgi) in PROFILES.items():
+        startups = [run(profile, STARTUP.format(wsgi=wsgi))
+            for _ in range(args.repeat)]
+        requests = run(profile, args=['--child', '-n', str(args.requests)])
+        print(f'{profile:<8}'
+            f'{statistics.median(s for s, _ in startups) * 1000:>12.1f}'
+            f'{startups[0][1]:>9}'
+            f'{requests["get"] * 1e6:>12.1f}'
+            f'{requests["post"] * 1000:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''
+Admin search latency, icontains vs the full-text index, as tickets grow.
+
+    python benchmarks/bench_search.py --sizes 10000 100000
+'''
+import argparse
+import timeit
+
+from harness import setup_django, test_database
+
+setup_django()
+
+from django.db.models import Q  # noqa: E402
+
+from benchmarks.payloads import evand_payloads  # noqa: E402
+from core.models import Ticket  # noqa: E402
+from core.search import search  # noqa: E402
+
+FIELDS = ('email', 'mobile', 'ticket_id', 'first_name', 'last_name')
+
+
+def icontains(term):
+    q = Q()
+    for field in FIELDS:
+        q |= Q(**{f'{field}__icontains': term})
+    return Ticket.objects.filter(q)
+
+
+def bench(name, func, term, repeat=20):
+    best = min(timeit.repeat(lambda: list(func(term)[:100]), number=1,
+        repeat=repeat))
+    print(f'  {name:<10} {best * 1000:8.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+        default=[10000, 100000])
+    parser.add_argument('--term', default='reza99')
+    args = parser.parse_args()
+
+    with test_database():
+        count = 0
+        for size in args.sizes:
+            for start in range(count, size, 5000):
+                Ticket.upsert_evand(evand_payloads(
+                    min(5000, size - start), start=start))
+            count = size
+            print(f'{Ticket.objects.count()} tickets, searching {args.term!r}')
+            bench('icontains', icontains, args.term)
+            bench('fts', lambda term: search(Ticket.objects.all(), term),
+                args.term)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+'''
+Load test of the webhook endpoint with generated Evand payloads.
+
+Runs against a throwaway test database, either through the Django test client
+(``--transport client``) or a local threaded WSGI server over HTTP
+(``--transport server``), at each ``--concurrency`` level, and reports req/s,
+p50/p95/p99 latency and DB queries per request.
+
+    python benchmarks/bench_webhook.py --concurrency 1 4 16
+    python benchmarks/bench_webhook.py --save-baseline
+    python benchmarks/bench_webhook.py --check   # exits 1 on regression
+
+Baselines in ``benchmarks/baselines/webhook.json`` are machine specific,
+regenerate them with ``--save-baseline`` on the CI runner.
+'''
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from harness import HEADER, row, setup_django, summarize, test_database
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.core.servers.basehttp import ThreadedWSGIServer, \
+    WSGIRequestHandler  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from benchmarks.payloads import evand_payloads  # noqa: E402
+from core import metrics  # noqa: E402
+
+BASELINE = Path(__file__).resolve().parent / 'baselines' / 'webhook.json'
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Runner:
+    def __init__(self, transport, url):
+        self.transport = transport
+        self.url = url
+        self.local = threading.local()
+
+    def post(self, payload):
+        start = time.perf_counter()
+        if self.transport == 'client':
+            client = getattr(self.local, 'client', None)
+            if client is None:
+                client = self.local.client = Client()
+            status = client.post(self.url, payload).status_code
+        else:
+            try:
+                with urlopen(self.url, urlencode(payload).encode()) as response:
+                    response.read()
+                    status = response.status
+            except HTTPError as e:
+                status = e.code
+        return time.perf_counter() - start, status
+
+    def run(self, payloads, concurrency):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(self.post, payloads))
+        return summarize(results, time.perf_counter() - start)
+
+
+def queries_per_request(url, payloads, warmup=()):
+    '''
+    Queries per request once ``warmup`` filled the per-process caches, such as
+    the ids of core.catalog.
+    '''
+    client = Client()
+    for payload in warmup:
+        client.post(url, payload)
+    with CaptureQueriesContext(connection) as queries:
+        for payload in payloads:
+            client.post(url, payload)
+    return len(queries) / len(payloads)
+
+
+def check(results, baseline, tolerance):
+    failures = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['rps'] < base['rps'] * (1 - tolerance):
+            failures.append(f'{key}: {result["rps"]:.0f} req/s, '
+                f'baseline {base["rps"]:.0f}')
+        if result['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            failures.append(f'{key}: p99 {result["p99_ms"]:.1f} ms, '
+                f'baseline {base["p99_ms"]:.1f}')
+        if result['queries'] > base['queries']:
+            failures.append(f'{key}: {result["queries"]:.1f} queries/request, '
+                f'baseline {base["queries"]:.1f}')
+        if result['errors'] > base['errors']:
+            failures.append(f'{key}: {result["errors"]} errors, '
+                f'baseline {base["errors"]}')
+    return failures
+
+
+def print_stages():
+    '''Mean time per call of each ingest stage, from core.metrics.'''
+    print(f'{"stage":<16}{"calls":>8}{"mean ms":>10}')
+    for stage, (count, total) in sorted(metrics.timers().items()):
+        print(f'{stage:<16}{count:>8}{total / count * 1000:>10.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--requests', type=int, default=500,
+        help='Requests per concurrency level.')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+        default=[1, 4, 16])
+    parser.add_argument('--transport', choices=('client', 'server'),
+        default='client')
+    parser.add_argument('--mode', choices=('inline', 'queue'),
+        help='Override WEBHOOK_INGEST_MODE.')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true',
+        help='Exit with 1 when results are worse than the baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.mode:
+        settings.WEBHOOK_INGEST_MODE = args.mode
+    server = None
+    with test_database():
+        try:
+            path = reverse('webhook')
+            url = path
+            if args.transport == 'server':
+                server = start_server()
+                url = f'http://127.0.0.1:{server.server_port}{path}'
+            runner = Runner(args.transport, url)
+            levels = len(args.concurrency)
+            payloads = evand_payloads(args.requests * (levels + 1))
+            chunks = [payloads[i::levels + 1] for i in range(levels + 1)]
+
+            queries = queries_per_request(path, chunks[0][:50],
+                warmup=chunks[0][50:])
+            results = {}
+            print(f'{args.transport}, {settings.WEBHOOK_INGEST_MODE} mode, '
+                f'{queries:.1f} queries/request')
+            print(HEADER)
+            for concurrency, chunk in zip(args.concurrency, chunks[1:]):
+                result = runner.run(chunk, concurrency)
+                result['queries'] = queries
+                results[f'{args.transport}-{settings.WEBHOOK_INGEST_MODE}-'
+                    f'c{concurrency}'] = result
+                print(row(concurrency, result))
+            print_stages()
+        finally:
+            if server:
+                server.shutdown()
+                server.server_close()
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) \
+            if args.baseline.exists() else {}
+        baseline.update(results)
+        args.baseline.parent.mkdir(exist_ok=True)
+        args.baseline.write_text(json.dumps(baseline, indent=2) + '\n')
+        print(f'Saved baseline to {args.baseline}')
+    if args.check:
+        baseline = json.loads(args.baseline.read_text())
+        failures = check(results, baseline, args.tolerance)
+        for failure in failures:
+            print(f'REGRESSION {failure}')
+        if failures:
+            sys.exit(1)
+        print('No regressions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+'''
+Shared setup of the benchmark scripts. Import it before anything that needs
+Django and call ``setup_django()``.
+'''
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EventApp.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    '''
+    A throwaway test database. SQLite databases are put in a temporary file
+    instead of memory, since the benchmarks use one connection per thread.
+    '''
+    from django.db import connections
+    from django.test.utils import setup_databases, setup_test_environment, \
+        teardown_databases, teardown_test_environment
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for alias in connections:
+            if connections[alias].vendor == 'sqlite':
+                connections[alias].settings_dict['TEST']['NAME'] = str(
+                    Path(tmp) / f'{alias}.sqlite3')
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            yield
+        finally:
+            connections.close_all()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def summarize(results, elapsed):
+    '''
+    ``results`` is a list of ``(latency seconds, HTTP status)``. Requests
+    turned away by core.backpressure count as shed, not as errors.
+    '''
+    latencies = [latency for latency, _ in results]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, status in results
+            if status >= 400 and status != 503),
+        'shed': sum(1 for _, status in results if status == 503),
+        'rps': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+HEADER = (f'{"concurrency":>11} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+    f'{"p99 ms":>8} {"errors":>6} {"shed":>6}')
+
+
+def row(concurrency, result):
+    return (f'{concurrency:>11} {result["rps"]:>8.0f} '
+        f'{result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} '
+        f'{result["p99_ms"]:>8.2f} {result["errors"]:>6} '
+        f'{result["shed"]:>6}')
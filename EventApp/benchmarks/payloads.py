@@ -0,0 +1,56 @@
+'''
+Generated Evand webhook payloads, shaped like the form data Evand posts to
+the hook endpoint.
+'''
+import random
+from datetime import datetime, timedelta, timezone
+
+TEHRAN = timezone(timedelta(hours=4, minutes=30))
+TYPES = ('normal', 'vip', 'student', 'early_bird')
+FIRST_NAMES = ('Sara', 'Ali', 'Maryam', 'Reza', 'Zahra', 'Mohammad')
+LAST_NAMES = ('Ahmadi', 'Hosseini', 'Karimi', 'Rezaei', 'Moradi')
+
+
+def evand_payload(i: int, rng: random.Random = None, events=20):
+    rng = rng or random.Random(i)
+    created = datetime(2022, 5, 1, tzinfo=TEHRAN) + timedelta(minutes=i)
+    updated = created + timedelta(minutes=rng.randint(0, 60))
+    first_name = rng.choice(FIRST_NAMES)
+    ticket_type = rng.choice(TYPES)
+    return {
+        'event': 'attendee.created',
+        'data[id]': str(900000 + i),
+        'data[ticket_id]': str(100000 + i),
+        'data[order_id]': str(500000 + i // 2),
+        'data[first_name]': first_name,
+        'data[last_name]': rng.choice(LAST_NAMES),
+        'data[email]': f'{first_name.lower()}{i}@example.com',
+        'data[mobile]': f'0912{i:07d}',
+        'data[discount_id]': rng.choice(('', '', str(rng.randint(1, 99)))),
+        'data[canceled]': rng.choice(('false',) * 9 + ('true',)),
+        'data[created_at]': created.isoformat(timespec='seconds'),
+        'data[updated_at]': updated.isoformat(timespec='seconds'),
+        'data[ticket][data][id]': str(7000 + TYPES.index(ticket_type)),
+        'data[ticket][data][event_id]': str(30000 + i % events),
+        'data[ticket][data][type]': ticket_type,
+        'data[ticket][data][title]': ticket_type.replace('_', ' ').title(),
+        'data[ticket][data][available_count]': str(rng.randint(0, 500)),
+        'data[ticket][data][price]': str(rng.choice((0, 150000, 250000))),
+        'data[ticket][data][description]': 'Entrance ticket',
+        'data[ticket][data][sale_start]': '2022-04-20T10:00:00+04:30',
+        'data[ticket][data][sale_end]': '2022-06-01T10:00:00+04:30',
+        'data[answers][0][question_id]': '11',
+        'data[answers][0][value]': 'Tehran',
+        'data[answers][1][question_id]': '12',
+        'data[answers][1][value]': 'Student',
+    }
+
+
+def evand_payloads(n: int, seed=0, start=0, **kwargs):
+    rng = random.Random(seed)
+    return [evand_payload(i, rng, **kwargs) for i in range(start, start + n)]
+
+
+def as_stored(payload: dict):
+    '''The payload as it is stored on WebHookMessage (QueryDict lists).'''
+    return {key: [value] for key, value in payload.items()}
@@ -2,7 +2,45 @@ from django.contrib import admin
 # from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
 
-from .models import WebHookMessage, Ticket, Attendee
+from .export import event_tickets, export_response
+from .models import WebHookMessage, Ticket, Attendee, EventStats, Event, \
+    TicketType
+from .pagination import FastPaginator
+from .search import search
+
+
+class FullTextSearchMixin:
+    '''Use the full-text index instead of ``icontains`` over search_fields.'''
+    def get_search_results(self, request, queryset, search_term):
+        if search_term:
+            results = search(queryset, search_term)
+            if results is not None:
+                return results, False
+        return super().get_search_results(request, queryset, search_term)
+
+
+def export_action(format, jalali=False):
+    '''Admin action streaming every ticket of the selected rows' events.'''
+    description = {'csv': 'CSV', 'jsonl': 'JSON Lines'}[format]
+    if jalali:
+        description += ' with Jalali dates'
+
+    @admin.action(
+        description=_('Export tickets of selected events as %s') % description)
+    def action(modeladmin, request, queryset):
+        event_ids = queryset.order_by().values(
+            modeladmin.export_event_field).distinct()
+        return export_response(event_tickets(event_ids), format, jalali)
+
+    action.__name__ = f'export_{format}{"_jalali" if jalali else ""}'
+    return action
+
+
+EXPORT_ACTIONS = [
+    export_action('csv'),
+    export_action('csv', jalali=True),
+    export_action('jsonl'),
+]
 
 
 # @admin.register(User)
@@ -31,25 +69,82 @@ from .models import WebHookMessage, Ticket, Attendee
 
 
 @admin.register(WebHookMessage)
-class WebHookMessageAdmin(admin.ModelAdmin):
-    ordering = ['received_at',]
+class WebHookMessageAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    # Ending in id makes the ordering total, see core.pagination.
+    ordering = ['received_at', 'id',]
+    paginator = FastPaginator
+    show_full_result_count = False
     list_display = ['received_at', 'id',]
     search_fields = ('payload',)
     list_filter = ('received_at',)
 
 
 @admin.register(Ticket)
-class WebHookMessageAdmin(admin.ModelAdmin):
-    ordering = ['updated_at', 'created_at',]
-    list_display = ['email', 'ticket_id', 'updated_at', 'type',]
-    search_fields = ('email', 'mobile', 'ticket_id', 'event_id',
-        'first_name', 'title', 'last_name',)
-    list_filter = ('event_id', 'type', 'canceled', 'updated_at',)
+class WebHookMessageAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    ordering = ['updated_at', 'created_at', 'id',]
+    paginator = FastPaginator
+    show_full_result_count = False
+    list_display = ['email', 'ticket_id', 'updated_at', 'ticket_type',]
+    list_select_related = ('ticket_type',)
+    search_fields = ('email', 'mobile', 'ticket_id', 'first_name',
+        'last_name',)
+    list_filter = ('event', 'ticket_type', 'canceled', 'updated_at',)
+    actions = EXPORT_ACTIONS
+    export_event_field = 'event__evand_id'
 
 
 @admin.register(Attendee)
 class WebHookMessageAdmin(admin.ModelAdmin):
-    ordering = ['ticket__updated_at',]
+    ordering = ['ticket__updated_at', 'id',]
+    paginator = FastPaginator
+    show_full_result_count = False
     list_display = ['phone_number', 'ticket', 'user',]
     search_fields = ('phone_number',)
     list_filter = ('user',)
+
+
+@admin.register(Event)
+class EventAdmin(admin.ModelAdmin):
+    ordering = ['evand_id',]
+    list_display = ['evand_id',]
+    search_fields = ('evand_id',)
+    actions = EXPORT_ACTIONS
+    export_event_field = 'evand_id'
+
+    # Created on ingest and cached by id, see core.catalog.
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TicketType)
+class TicketTypeAdmin(admin.ModelAdmin):
+    ordering = ['event__evand_id', 'type',]
+    list_display = ['event', 'type', 'title', 'description',]
+    list_select_related = ('event',)
+    search_fields = ('event__evand_id', 'type', 'title',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(EventStats)
+class EventStatsAdmin(admin.ModelAdmin):
+    ordering = ['event_id', 'type',]
+    list_display = ['event_id', 'type', 'sold', 'canceled', 'revenue',
+        'updated_at',]
+    search_fields = ('event_id',)
+    list_filter = ('type',)
+    actions = EXPORT_ACTIONS
+    export_event_field = 'event_id'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from .checkin import invalidate, ticket_saved
+        from .db import configure_sqlite
+        from .models import Ticket, tickets_changed
+        from .search import sync_sqlite_index
+        connection_created.connect(configure_sqlite,
+            dispatch_uid='core.db.configure_sqlite')
+        post_migrate.connect(sync_sqlite_index, sender=self,
+            dispatch_uid='core.search.sync_sqlite_index')
+        tickets_changed.connect(invalidate,
+            dispatch_uid='core.checkin.invalidate')
+        for signal in (post_save, post_delete):
+            signal.connect(ticket_saved, sender=Ticket,
+                dispatch_uid='core.checkin.ticket_saved')
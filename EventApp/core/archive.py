@@ -0,0 +1,106 @@
+'''
+Cold storage for webhook messages past the retention window.
+
+Messages are appended to one gzipped JSON Lines file per day of
+``received_at``, ``<WEBHOOK_ARCHIVE_DIR>/2022/05/2022-05-11.jsonl.gz``, one
+message per line. Every write adds a gzip member, which ``gzip.open`` reads
+back as one stream.
+'''
+import gzip
+import json
+import os
+import time
+from itertools import groupby
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import metrics
+from core.models import WebHookMessage
+from core.retention import dead_letter_stale, expired_messages
+
+FIELDS = ('id', 'received_at', 'status', 'content_hash', 'payload')
+
+
+def archive_path(directory, day):
+    return Path(directory, f'{day:%Y}', f'{day:%m}', f'{day:%Y-%m-%d}.jsonl.gz')
+
+
+def write_records(path, records):
+    '''Append ``records`` to ``path`` and fsync it.'''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+            for record in records:
+                f.write(json.dumps(record, cls=DjangoJSONEncoder,
+                    separators=(',', ':')).encode() + b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archive_expired(directory=None, days=None, chunk_size=1000,
+        time_budget=None):
+    '''
+    Move expired messages to the archive in chunks: a chunk is deleted only
+    once it is on disk, so an interrupted run archives some messages twice at
+    worst, which a replay applies idempotently.
+    Stops early once ``time_budget`` seconds have passed.
+    Returns the number of archived messages.
+    '''
+    directory = directory or settings.WEBHOOK_ARCHIVE_DIR
+    deadline = time_budget and time.monotonic() + time_budget
+    dead_letter_stale(days, chunk_size)
+    qs = expired_messages(days).order_by('received_at', 'id').values(*FIELDS)
+    archived = 0
+    while not deadline or time.monotonic() < deadline:
+        records = list(qs[:chunk_size])
+        if not records:
+            break
+        with metrics.timer('retention_archive'):
+            for day, group in groupby(records,
+                    lambda r: timezone.localdate(r['received_at'])):
+                write_records(archive_path(directory, day), group)
+            archived += WebHookMessage.objects.filter(
+                id__in=[r['id'] for r in records]).delete()[0]
+    return archived
+
+
+def archive_files(paths):
+    '''Archive files under ``paths`` (files or directories), oldest first.'''
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(path.rglob('*.jsonl.gz'))
+        else:
+            files.append(path)
+    return sorted(files, key=lambda path: path.name)
+
+
+def aware(value):
+    '''``value`` in the default time zone if it is naive.'''
+    if value is not None and timezone.is_naive(value):
+        return timezone.make_aware(value, timezone.get_default_timezone())
+    return value
+
+
+def read_archive(paths, since=None, until=None):
+    '''
+    Yield the archived messages in ``paths`` as dicts, optionally only those
+    received in ``[since, until)``. Naive bounds are taken in the default
+    time zone, like the ORM does.
+    '''
+    since, until = aware(since), aware(until)
+    for path in archive_files(paths):
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                record = json.loads(line)
+                received_at = parse_datetime(record['received_at'])
+                if since and received_at < since:
+                    continue
+                if until and received_at >= until:
+                    continue
+                record['received_at'] = received_at
+                yield record
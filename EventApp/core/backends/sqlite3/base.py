@@ -0,0 +1,27 @@
+'''
+SQLite backend with the ``transaction_mode`` option of Django 5.1.
+
+A ``DEFERRED`` transaction that reads and then writes cannot wait for
+another writer: it fails with "database is locked" as soon as the database
+changed under it, whatever busy_timeout says. ``IMMEDIATE`` takes the write
+lock at BEGIN, so concurrent writers queue up instead.
+'''
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        mode = params.pop('transaction_mode', None) or 'DEFERRED'
+        if mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode must be one of {TRANSACTION_MODES}.')
+        self.transaction_mode = mode.upper()
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -0,0 +1,184 @@
+'''
+Load shedding for the webhook. During a sale launch Evand delivers faster
+than SQLite can write, and requests that pile up behind the write lock time
+out and are redelivered, which adds to the pile. Past a ceiling of requests
+in flight the hook answers 503 with Retry-After at once instead, and Evand
+retries once the burst is over.
+
+The ceiling has to hold across processes: gunicorn's sync workers serve one
+request each, so a count per process never sheds and the burst waits in the
+listen backlog instead. ``SlotLimiter`` counts with file locks shared by the
+workers of a host, ``InFlightLimiter`` is the fallback without ``fcntl``.
+'''
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class InFlightLimiter:
+    '''
+    Admits at most ``limit`` requests at once, ``0`` admits all. Up to
+    ``queue`` more wait at most ``timeout`` seconds for a free slot, the rest
+    are turned away.
+    '''
+
+    def __init__(self, limit, queue=0, timeout=0):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, wait=True):
+        '''
+        Whether the request was admitted, if so ``release`` it after. Callers
+        that queue the work themselves, like ``async_webhook`` on its
+        executor, pass ``wait=False`` to be admitted up to ``limit + queue``
+        without waiting.
+        '''
+        with self.condition:
+            ceiling = self.limit if wait else self.limit + self.queue
+            if not self.limit or self.active < ceiling:
+                self.active += 1
+                return True
+            if not wait or self.waiting >= self.queue:
+                return False
+            self.waiting += 1
+            try:
+                admitted = self.condition.wait_for(
+                    lambda: self.active < self.limit, self.timeout)
+            finally:
+                self.waiting -= 1
+            if admitted:
+                self.active += 1
+            return admitted
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+
+class SlotLimiter:
+    '''
+    ``InFlightLimiter`` for all processes using ``directory``: a request
+    holds an exclusive ``flock`` on one of ``limit`` slot files, and a
+    waiting one on one of ``queue`` more while it polls for a free slot,
+    backing off up to MAX_POLL_INTERVAL. The kernel drops the locks of a
+    worker that dies, so slots cannot leak.
+
+    Each process opens the slot files once. Threads of a process share the
+    descriptors, and a lock is its descriptor's whoever takes it, so the
+    slots a process holds are also tracked in ``busy``.
+    '''
+    POLL_INTERVAL = 0.001
+    MAX_POLL_INTERVAL = 0.025
+
+    def __init__(self, directory, limit, queue=0, timeout=0):
+        self.directory = Path(directory)
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.pid = None
+        self.fds = {}
+        self.busy = set()
+        # Slots this process holds, which are all alike, so ``release``
+        # frees any of them.
+        self.held = []
+        self.lock = threading.Lock()
+
+    def open(self):
+        '''
+        Open the slot files in a new process. A forked one must not use the
+        descriptors it inherited, their locks are shared with the parent.
+        '''
+        for fds in self.fds.values():
+            for fd in fds:
+                os.close(fd)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fds = {
+            kind: [os.open(self.directory / f'{kind}-{i}',
+                os.O_RDWR | os.O_CREAT, 0o600) for i in range(count)]
+            for kind, count in (('active', self.limit), ('queued', self.queue))
+        }
+        self.busy = set()
+        self.held = []
+        self.pid = os.getpid()
+
+    def take(self, kind):
+        '''A free ``kind`` slot, now locked, or None.'''
+        with self.lock:
+            if self.pid != os.getpid():
+                self.open()
+            for i, fd in enumerate(self.fds[kind]):
+                if (kind, i) in self.busy:
+                    continue
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                self.busy.add((kind, i))
+                return kind, i
+        return None
+
+    def free(self, slot):
+        kind, i = slot
+        with self.lock:
+            fcntl.flock(self.fds[kind][i], fcntl.LOCK_UN)
+            self.busy.discard(slot)
+
+    def acquire(self, wait=True):
+        '''See ``InFlightLimiter.acquire``.'''
+        if not self.limit:
+            return True
+        slot = self.take('active')
+        if slot is None and not wait:
+            slot = self.take('queued')
+        elif slot is None:
+            queued = self.take('queued')
+            if queued is None:
+                return False
+            try:
+                deadline = time.monotonic() + self.timeout
+                delay = self.POLL_INTERVAL
+                while slot is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    time.sleep(min(delay, remaining))
+                    delay = min(delay * 2, self.MAX_POLL_INTERVAL)
+                    slot = self.take('active')
+            finally:
+                self.free(queued)
+        if slot is None:
+            return False
+        with self.lock:
+            self.held.append(slot)
+        return True
+
+    def release(self):
+        with self.lock:
+            slot = self.held.pop() if self.held else None
+        if slot is not None:
+            self.free(slot)
+
+
+def make_limiter():
+    if settings.WEBHOOK_LIMITER_DIR and fcntl is not None:
+        return SlotLimiter(settings.WEBHOOK_LIMITER_DIR,
+            settings.WEBHOOK_MAX_IN_FLIGHT, settings.WEBHOOK_MAX_QUEUED,
+            settings.WEBHOOK_QUEUE_TIMEOUT)
+    return InFlightLimiter(settings.WEBHOOK_MAX_IN_FLIGHT,
+        settings.WEBHOOK_MAX_QUEUED, settings.WEBHOOK_QUEUE_TIMEOUT)
+
+
+limiter = make_limiter()
@@ -0,0 +1,12 @@
+'''
+Events and ticket types, which tickets reference by foreign key instead of
+repeating them on every row. Their ids are kept in a bounded in-process LRU
+so that tickets of known types are ingested without extra queries, see
+``TicketTypeQuerySet.resolve``.
+'''
+from django.conf import settings
+
+from core.lru import LRU
+
+# (event_id, type): (Event pk, TicketType pk, title, description)
+types = LRU(settings.CATALOG_CACHE_SIZE)
@@ -0,0 +1,217 @@
+'''
+Ticket check-in at the venue doors.
+
+Tickets are looked up by ``ticket_id`` (unique index) or ``mobile`` (index)
+through the default cache. Ingest drops the cached entries of the tickets it
+writes once its transaction commits, see ``invalidate``, and entries expire
+after CHECKIN_CACHE_TIMEOUT in case an invalidation is missed.
+
+Checking in is one conditional UPDATE, so a ticket scanned at two doors at
+once is only admitted at one of them. Devices that were offline send their
+scans in one batch to ``sync``, where the earliest scan of a ticket wins.
+
+A ticket admits one person, so the check-in is kept on Ticket. Attendee,
+the optional link of a ticket to a site user, is neither read nor written.
+'''
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import Ticket, tickets_changed
+
+FIELDS = (
+    'ticket_id', 'event_id', 'type', 'title', 'first_name', 'last_name',
+    'mobile', 'canceled', 'checked_in_at', 'checked_in_device',
+)
+
+CHECKED_IN = 'checked_in'
+ALREADY_CHECKED_IN = 'already_checked_in'
+CANCELED = 'canceled'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+
+
+def ticket_key(ticket_id):
+    return f'checkin:ticket:{ticket_id}'
+
+
+def mobile_key(mobile):
+    return f'checkin:mobile:{mobile}'
+
+
+def read(queryset, fields=FIELDS):
+    '''Tickets of ``queryset`` as dicts of ``fields``.'''
+    lookups = [Ticket.CATALOG_LOOKUPS.get(field, field) for field in fields]
+    return [dict(zip(fields, row)) for row in queryset.values_list(*lookups)]
+
+
+def get_tickets(ticket_ids):
+    '''
+    ``{ticket_id: ticket}`` with None for unknown tickets, which are cached
+    too. The ones missing from the cache are read in one query.
+    '''
+    keys = {ticket_key(ticket_id): ticket_id for ticket_id in ticket_ids}
+    tickets = {keys[key]: ticket
+        for key, ticket in cache.get_many(keys).items()}
+    missing = [ticket_id for ticket_id in keys.values()
+        if ticket_id not in tickets]
+    if missing:
+        found = {ticket['ticket_id']: ticket
+            for ticket in read(Ticket.objects.filter(ticket_id__in=missing))}
+        loaded = {ticket_id: found.get(ticket_id) for ticket_id in missing}
+        cache.set_many({ticket_key(ticket_id): ticket
+            for ticket_id, ticket in loaded.items()},
+            settings.CHECKIN_CACHE_TIMEOUT)
+        tickets.update(loaded)
+    return tickets
+
+
+def get_ticket(ticket_id):
+    return get_tickets([ticket_id])[ticket_id]
+
+
+def find_by_mobile(mobile):
+    '''Tickets bought with ``mobile``, oldest first.'''
+    key = mobile_key(mobile)
+    ticket_ids = cache.get(key)
+    if ticket_ids is None:
+        tickets = read(Ticket.objects.filter(mobile=mobile).exclude(
+            ticket_id=None).order_by('id'))
+        ticket_ids = [ticket['ticket_id'] for ticket in tickets]
+        cache.set_many({
+            key: ticket_ids,
+            **{ticket_key(ticket['ticket_id']): ticket for ticket in tickets},
+        }, settings.CHECKIN_CACHE_TIMEOUT)
+        return tickets
+    tickets = get_tickets(ticket_ids)
+    # Left out when its mobile changed after the list was cached.
+    return [tickets[ticket_id] for ticket_id in ticket_ids
+        if tickets[ticket_id] and tickets[ticket_id]['mobile'] == mobile]
+
+
+def check_in(ticket_id, at=None, device=None):
+    '''
+    Check the ticket in unless it is canceled or already in. Returns
+    ``(status, ticket)`` with the ticket as stored after the attempt.
+    '''
+    updated = Ticket.objects.filter(ticket_id=ticket_id, canceled=False,
+        checked_in_at=None).update(checked_in_at=at or timezone.now(),
+        checked_in_device=device)
+    cache.delete(ticket_key(ticket_id))
+    ticket = get_ticket(ticket_id)
+    if updated:
+        return CHECKED_IN, ticket
+    if ticket is None:
+        return NOT_FOUND, None
+    if ticket['canceled']:
+        return CANCELED, ticket
+    return ALREADY_CHECKED_IN, ticket
+
+
+def parse_scan(scan):
+    '''
+    ``(ticket_id, scanned_at, device)`` of an offline scan, ValueError when
+    it is malformed. Naive times are in the current time zone.
+    '''
+    if not isinstance(scan, dict):
+        raise ValueError('A scan is an object.')
+    ticket_id, scanned_at, device = (scan.get('ticket_id'),
+        scan.get('scanned_at'), scan.get('device'))
+    if not isinstance(ticket_id, str) or not ticket_id:
+        raise ValueError('ticket_id is required.')
+    scanned_at = parse_datetime(scanned_at) if isinstance(scanned_at,
+        str) else None
+    if not scanned_at:
+        raise ValueError('scanned_at is not a date and time.')
+    if timezone.is_naive(scanned_at):
+        scanned_at = timezone.make_aware(scanned_at)
+    if device is not None and not isinstance(device, str):
+        raise ValueError('device is not a string.')
+    return ticket_id, scanned_at, device and device[:50]
+
+
+def sync(scans):
+    '''
+    Apply the scans a door device took while offline. Returns ``(status,
+    ticket)`` per scan, in order, where status is INVALID for malformed
+    scans.
+
+    The earliest scan of a ticket is its check-in, whatever order devices
+    sync in: it replaces a stored check-in that is later, and the other
+    scans are ALREADY_CHECKED_IN. Ties go to the stored check-in, then the
+    lowest device, then the first of the batch. The tickets are read and
+    written in bulk in one transaction.
+    '''
+    parsed = []
+    for scan in scans:
+        try:
+            parsed.append(parse_scan(scan))
+        except ValueError:
+            parsed.append(None)
+    ticket_ids = {scan[0] for scan in parsed if scan}
+    if not ticket_ids:
+        return [(INVALID, None)] * len(parsed)
+
+    with transaction.atomic():
+        # Locked in ticket_id order like TicketQuerySet._upsert, so that a
+        # sync and an ingest batch cannot deadlock.
+        tickets = {ticket['ticket_id']: ticket for ticket in read(
+            Ticket.objects.select_for_update(of=('self',)).filter(
+                ticket_id__in=ticket_ids).order_by('ticket_id'),
+            ('id',) + FIELDS)}
+        earliest = {}
+        for i, scan in enumerate(parsed):
+            if scan and scan[0] in tickets:
+                key = (scan[1], scan[2] or '', i)
+                earliest[scan[0]] = min(earliest.get(scan[0], key), key)
+        winners = {}
+        for ticket_id, (scanned_at, device, i) in earliest.items():
+            ticket = tickets[ticket_id]
+            stored = ticket['checked_in_at']
+            if ticket['canceled'] or stored and stored <= scanned_at:
+                continue
+            ticket.update(checked_in_at=scanned_at,
+                checked_in_device=parsed[i][2])
+            winners[i] = Ticket(id=ticket['id'], ticket_id=ticket_id,
+                mobile=ticket['mobile'], checked_in_at=scanned_at,
+                checked_in_device=parsed[i][2])
+        Ticket.objects.bulk_update(winners.values(),
+            ['checked_in_at', 'checked_in_device'])
+        written = list(winners.values())
+        transaction.on_commit(
+            lambda: tickets_changed.send(Ticket, tickets=written))
+
+    for ticket in tickets.values():
+        del ticket['id']
+    results = []
+    for i, scan in enumerate(parsed):
+        ticket = scan and tickets.get(scan[0])
+        if scan is None:
+            results.append((INVALID, None))
+        elif ticket is None:
+            results.append((NOT_FOUND, None))
+        elif i in winners:
+            results.append((CHECKED_IN, ticket))
+        elif ticket['canceled']:
+            results.append((CANCELED, ticket))
+        else:
+            results.append((ALREADY_CHECKED_IN, ticket))
+    return results
+
+
+def invalidate(sender, tickets, **kwargs):
+    '''``tickets_changed`` receiver dropping the cached lookups of tickets.'''
+    keys = []
+    for ticket in tickets:
+        if ticket.ticket_id is not None:
+            keys.append(ticket_key(ticket.ticket_id))
+        if ticket.mobile:
+            keys.append(mobile_key(ticket.mobile))
+    cache.delete_many(keys)
+
+
+def ticket_saved(sender, instance, **kwargs):
+    '''``post_save`` and ``post_delete`` receiver, for edits in the admin.'''
+    invalidate(sender, [instance])
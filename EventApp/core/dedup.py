@@ -0,0 +1,30 @@
+'''
+Duplicate delivery detection. Evand redelivers a webhook when it times out,
+so each payload is identified by a hash of its content. Recent hashes are
+kept in a bounded in-process LRU, and WebHookMessage.content_hash is unique
+so duplicates are caught across processes as well.
+'''
+import hashlib
+import json
+from django.conf import settings
+
+from core.lru import LRU
+
+
+def payload_hash(payload):
+    '''
+    SHA-256 of the form data with sorted keys. Both entry points hash the
+    same form: the QueryDict of a webhook POST, and the dict of lists
+    ``core.evand.flatten_evand_data`` makes of a batch entry, so a delivery
+    redelivered through the other one is still a duplicate.
+    '''
+    items = payload.lists() if hasattr(payload, 'lists') else payload.items()
+    canonical = sorted(
+        (key, value if isinstance(value, list) else [value])
+        for key, value in items
+    )
+    return hashlib.sha256(json.dumps(canonical, ensure_ascii=False,
+        separators=(',', ':'), sort_keys=True).encode()).hexdigest()
+
+
+recent = LRU(settings.WEBHOOK_DEDUP_CACHE_SIZE)
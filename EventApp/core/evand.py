@@ -1,13 +1,211 @@
-import re
+import json
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
 
+from django.utils import dateparse, timezone
+
+
+@lru_cache(maxsize=4096)
+def tokenize_key(key: str):
+    '''
+    Split a form key like ``data[ticket][data][price]`` into the path
+    ``('data', 'ticket', 'data')``, the leaf ``'price'`` and whether the key
+    ends in ``[]``. Evand sends almost the same key set on every delivery,
+    so the result is cached. Keys that are not bracketed are a single leaf.
+    '''
+    i = key.find('[')
+    if i <= 0 or not key.endswith(']'):
+        return (), key, False
+    tokens = (key[:i], *key[i + 1:-1].split(']['))
+    if tokens[-1] == '':
+        return tokens[:-2], tokens[-2], True
+    return tokens[:-1], tokens[-1], False
+
+
+def evaluate_evand_fucking_data(data):
+    '''
+    Turn Evand's flat form keys into nested dicts in a single pass:
+    ``{'data[ticket][data][price]': '10'}`` becomes
+    ``{'data': {'ticket': {'data': {'price': '10'}}}}``.
+
+    ``data`` may be a QueryDict or a dict of lists (a stored payload), in
+    which case the last value wins like ``QueryDict.get``. Keys ending in
+    ``[]`` keep all of their values as a list.
+    '''
+    tree = {}
+    items = data.lists() if hasattr(data, 'lists') else data.items()
+    for key, values in items:
+        path, leaf, multi = tokenize_key(key)
+        node = tree
+        for token in path:
+            child = node.get(token)
+            if type(child) is not dict:
+                # Missing, or a plain value was sent for a key that also has
+                # children.
+                node[token] = child = {}
+            node = child
+        if type(node.get(leaf)) is dict:
+            # Whichever comes first, children win over a plain value.
+            continue
+        if type(values) is not list:
+            node[leaf] = [values] if multi else values
+        elif multi:
+            node[leaf] = values
+        else:
+            node[leaf] = values[-1] if values else None
+    return tree
+
+
+def flatten_evand_data(data):
+    '''
+    The form data of a JSON object, the inverse of
+    ``evaluate_evand_fucking_data``: a dict of lists of strings like
+    ``QueryDict.lists()``, for batch deliveries that are flat or nested and
+    may hold JSON numbers, booleans or nulls. Nulls are left out and other
+    non-string values become their JSON text (``150000``, ``false``), as
+    Evand would have posted them.
+    '''
+    form = {}
+
+    def add(key, value):
+        if isinstance(value, dict):
+            for name, child in value.items():
+                add(f'{key}[{name}]', child)
+        elif isinstance(value, list):
+            form[key] = [form_value(item) for item in value
+                if item is not None]
+        elif value is not None:
+            form[key] = [form_value(value)]
 
-def evaluate_evand_fucking_data(data:dict):
-    new_data = dict()
     for key, value in data.items():
-        keys = key[5:].split('[')
-        keys.reverse()
-        dic = {keys[1][:-1]: {keys[0][:-1]: value,},}
-        for i, k in enumerate(keys[1:-1]):
-            k = k[:-1]
-            dic[i+1][:1] = {k: dic.pop(k),}
-        new_data[keys[-1][:-1]
\ No newline at end of file
+        add(key, value)
+    return form
+
+
+def form_value(value):
+    return value if isinstance(value, str) else json.dumps(value,
+        ensure_ascii=False)
+
+
+def parse_datetime(value: str):
+    '''
+    Fast path for Evand's ISO-8601 timestamps (``2022-05-11T20:00:00+04:30``).
+    Before Python 3.11 ``fromisoformat`` rejects ``+0430`` offsets and
+    fractions other than 3 or 6 digits, those fall back to Django's parser.
+    Naive values are taken as UTC.
+    '''
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        date = dateparse.parse_datetime(value.strip())
+        if date is None:
+            raise ValueError(f'Invalid datetime: {value!r}') from None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=dt_timezone.utc)
+    return date
+
+
+def to_int(value: str):
+    '''``'150000'``, ``'150,000'`` or ``'150000.00'`` to 150000, blanks to None.'''
+    value = value.strip().replace(',', '')
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return int(Decimal(value))
+    except InvalidOperation:
+        raise ValueError(f'Invalid number: {value!r}') from None
+
+
+def to_bool(value: str):
+    return value.strip().lower() in ('true', '1', 'yes', 'on')
+
+
+class Field:
+    '''
+    One Evand value: ``path`` is the bracket key without the ``data`` root,
+    e.g. ``'ticket.data.price'`` for ``data[ticket][data][price]``.
+    ``coerce`` converts the raw string and ``default`` is called when the
+    key is missing.
+    '''
+    __slots__ = ('path', 'coerce', 'default')
+
+    def __init__(self, path, coerce=None, default=None):
+        self.path = tuple(path.split('.'))
+        self.coerce = coerce
+        self.default = default
+
+
+def compile_mapping(mapping: dict):
+    '''
+    Compile ``{attribute: Field}`` into an extractor that takes a payload and
+    returns ``{attribute: value}``. The payload can be flat (a QueryDict, a
+    plain dict, or a stored payload whose values are lists) or already nested
+    by ``evaluate_evand_fucking_data``. The flat keys are built once here so
+    extraction is one dict lookup per field.
+    '''
+    fields = tuple(
+        (name, 'data' + ''.join(f'[{p}]' for p in field.path), field.path,
+            field.coerce, field.default)
+        for name, field in mapping.items()
+    )
+    missing = object()
+
+    def extract(data):
+        if isinstance(data.get('data'), dict):
+            return extract_nested(data['data'])
+        get = data.get
+        values = {}
+        for name, key, _, coerce, default in fields:
+            value = get(key, missing)
+            if type(value) is list:
+                value = value[-1] if value else None
+            if value is missing:
+                value = default() if default else None
+            elif coerce is not None and value is not None:
+                value = coerce(value)
+            values[name] = value
+        return values
+
+    def extract_nested(data):
+        values = {}
+        for name, _, path, coerce, default in fields:
+            value = data
+            for token in path:
+                value = value.get(token, missing) \
+                    if type(value) is dict else missing
+            if value is missing:
+                value = default() if default else None
+            elif coerce is not None and value is not None:
+                value = coerce(value)
+            values[name] = value
+        return values
+
+    return extract
+
+
+TICKET_MAPPING = {
+    'event_id': Field('ticket.data.event_id'),
+    'ticket_id': Field('ticket_id'),
+    'type': Field('ticket.data.type'),
+    'title': Field('ticket.data.title'),
+    'available_count': Field('ticket.data.available_count', to_int),
+    'price': Field('ticket.data.price', to_int),
+    'description': Field('ticket.data.description'),
+    'first_name': Field('first_name'),
+    'last_name': Field('last_name'),
+    'email': Field('email'),
+    'mobile': Field('mobile'),
+    'discount_id': Field('discount_id'),
+    'canceled': Field('canceled', to_bool, lambda: False),
+    'created_at': Field('created_at', parse_datetime, timezone.now),
+    'updated_at': Field('updated_at', parse_datetime, timezone.now),
+}
+
+extract_ticket = compile_mapping(TICKET_MAPPING)
@@ -0,0 +1,275 @@
+'''
+The webhook endpoint and the metrics of the ingest path. Kept apart from
+core.views so that ingest nodes (EventApp.settings_ingest) do not import
+DRF or the export code.
+'''
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.transaction import non_atomic_requests
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, \
+    HttpResponseNotAllowed, JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.utils import timezone
+
+from core import backpressure, dedup, metrics
+from core.dedup import payload_hash
+from core.evand import evaluate_evand_fucking_data, flatten_evand_data
+from core.ingest import process_message, process_new_messages
+from core.models import WebHookMessage
+
+logger = logging.getLogger(__name__)
+
+
+def store_webhook(payload, digest=None):
+    '''
+    Store the message nested, which is about a third smaller than the flat
+    form data, and in inline mode process it. Returns None for a payload
+    that was already received.
+    '''
+    if digest is None:
+        digest = payload_hash(payload)
+    if digest in dedup.recent:
+        metrics.increment('webhook_duplicates')
+        return None
+    try:
+        with metrics.timer('raw_write'), transaction.atomic():
+            message = WebHookMessage.objects.create(
+                received_at=timezone.now(),
+                payload=evaluate_evand_fucking_data(payload),
+                content_hash=digest,
+            )
+    except IntegrityError:
+        dedup.recent.add(digest)
+        metrics.increment('webhook_duplicates')
+        return None
+    dedup.recent.add(digest)
+    # In queue mode the message is left pending for process_webhooks.
+    if settings.WEBHOOK_INGEST_MODE == 'inline':
+        process_message(message)
+    return message
+
+
+# Results of a batch delivery besides the WebHookMessage statuses.
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+ERROR = 'error'
+
+
+def store_webhooks(payloads):
+    '''
+    ``store_webhook`` for many payloads in one transaction: the known
+    hashes are read in one query, the new messages inserted with one
+    bulk_create and in inline mode their tickets upserted at once. Returns a
+    result per payload, the status of its message or DUPLICATE.
+    '''
+    digests = [payload_hash(payload) for payload in payloads]
+    with metrics.timer('batch_write'), transaction.atomic():
+        stored = set(WebHookMessage.objects.filter(
+            content_hash__in=digests).values_list('content_hash', flat=True))
+        messages = {}
+        for payload, digest in zip(payloads, digests):
+            if digest not in messages and digest not in stored \
+                    and digest not in dedup.recent:
+                messages[digest] = WebHookMessage(
+                    received_at=timezone.now(),
+                    payload=evaluate_evand_fucking_data(payload),
+                    content_hash=digest,
+                )
+        if settings.WEBHOOK_INGEST_MODE == 'inline':
+            process_new_messages(messages.values())
+        # A concurrent delivery of the same payload stores it once, its
+        # ticket upserted twice is the same ticket.
+        WebHookMessage.objects.bulk_create(messages.values(),
+            ignore_conflicts=True)
+
+    results = []
+    for digest in digests:
+        dedup.recent.add(digest)
+        message = messages.pop(digest, None)
+        if message is None:
+            metrics.increment('webhook_duplicates')
+            results.append({'status': DUPLICATE})
+        elif message.last_error:
+            results.append({'status': message.status,
+                'error': message.last_error})
+        else:
+            results.append({'status': message.status})
+    return results
+
+
+def read_batch(request):
+    '''
+    Payloads of a JSON array or of JSON Lines (NDJSON) as form data, see
+    ``flatten_evand_data``, None for lines that are not JSON objects.
+    ValueError when the array is not valid JSON.
+    '''
+    body = request.body.decode()
+    if body.lstrip().startswith('['):
+        items = json.loads(body)
+    else:
+        items = []
+        for line in body.splitlines():
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    items.append(None)
+    return [flatten_evand_data(item) if isinstance(item, dict) else None
+        for item in items]
+
+
+def overloaded():
+    '''Asks Evand to deliver again later, see core.backpressure.'''
+    metrics.increment('webhook_shed')
+    response = HttpResponse('Overloaded, retry later.', status=503,
+        content_type='text/plain')
+    response['Retry-After'] = str(settings.WEBHOOK_RETRY_AFTER)
+    return response
+
+
+@csrf_exempt
+@require_POST
+@non_atomic_requests
+def webhook(request):
+    metrics.increment('webhook_received')
+    limiter = backpressure.limiter
+    with metrics.timer('queue_wait'):
+        admitted = limiter.acquire()
+    if not admitted:
+        return overloaded()
+    try:
+        with metrics.timer('request'):
+            store_webhook(request.POST.copy())
+    except Exception:
+        metrics.increment('webhook_errors')
+        logger.exception('Webhook delivery not stored',
+            extra={'ticket_id': request.POST.get('data[ticket_id]')})
+    finally:
+        limiter.release()
+    return HttpResponse("Message received okay.", content_type="text/plain")
+
+
+@csrf_exempt
+@require_POST
+@non_atomic_requests
+def webhook_batch(request):
+    '''
+    Many deliveries in one request, for the relay and bulk redelivery: a
+    JSON array or JSON Lines of the form data as objects (flat keys like
+    ``data[ticket_id]``, or nested). Stored and processed in chunks of
+    WEBHOOK_BATCH_CHUNK_SIZE, one transaction each, and answered with a
+    result per payload in order. Results of ``error`` were not stored,
+    send them again.
+    '''
+    try:
+        payloads = read_batch(request)
+    except ValueError:
+        return HttpResponseBadRequest('Expected a JSON array or JSON Lines.',
+            content_type='text/plain')
+    metrics.increment('webhook_received', len(payloads))
+    limiter = backpressure.limiter
+    with metrics.timer('queue_wait'):
+        admitted = limiter.acquire()
+    if not admitted:
+        return overloaded()
+    results = []
+    try:
+        size = settings.WEBHOOK_BATCH_CHUNK_SIZE
+        for start in range(0, len(payloads), size):
+            chunk = payloads[start:start + size]
+            valid = [payload for payload in chunk if payload is not None]
+            try:
+                stored = iter(store_webhooks(valid))
+            except Exception:
+                metrics.increment('webhook_errors', len(valid))
+                logger.exception('Webhook batch chunk not stored',
+                    extra={'size': len(valid)})
+                stored = iter([{'status': ERROR}] * len(valid))
+            results.extend({'status': INVALID} if payload is None
+                else next(stored) for payload in chunk)
+    finally:
+        limiter.release()
+    return JsonResponse({'results': results})
+
+
+_executor = None
+
+
+def get_executor():
+    '''
+    Threads doing the database writes of ``async_webhook``. The pool is
+    bounded so a burst cannot open more connections than
+    WEBHOOK_ASYNC_WORKERS.
+    '''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.WEBHOOK_ASYNC_WORKERS,
+            thread_name_prefix='webhook',
+        )
+    return _executor
+
+
+def _store_webhook_in_thread(payload, digest):
+    close_old_connections()
+    try:
+        return store_webhook(payload, digest)
+    finally:
+        close_old_connections()
+
+
+async def async_webhook(request):
+    '''
+    ``webhook`` for ASGI. The event loop only parses the body, the write runs
+    on ``get_executor()`` and the request is acked once it is durable.
+    '''
+    # Django 3.2's method and csrf decorators do not wrap coroutines.
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    metrics.increment('webhook_received')
+    # The executor's queue is the waiting line, so the limiter does not
+    # block the event loop.
+    limiter = backpressure.limiter
+    if not limiter.acquire(wait=False):
+        return overloaded()
+    try:
+        with metrics.timer('request'):
+            payload = request.POST.copy()
+            digest = payload_hash(payload)
+            if digest in dedup.recent:
+                metrics.increment('webhook_duplicates')
+            else:
+                await asyncio.get_running_loop().run_in_executor(
+                    get_executor(), _store_webhook_in_thread, payload, digest)
+    except Exception:
+        metrics.increment('webhook_errors')
+        logger.exception('Webhook delivery not stored',
+            extra={'ticket_id': request.POST.get('data[ticket_id]')})
+    finally:
+        limiter.release()
+    return HttpResponse("Message received okay.", content_type="text/plain")
+
+
+async_webhook.csrf_exempt = True
+
+
+def metrics_view(request):
+    '''
+    Counters and stage timers of all processes for Prometheus, behind
+    ``Authorization: Bearer <METRICS_TOKEN>``.
+    '''
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404
+    if not constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
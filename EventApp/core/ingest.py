@@ -0,0 +1,156 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from core import metrics
+from core.models import WebHookMessage, Ticket
+
+logger = logging.getLogger(__name__)
+
+
+@transaction.atomic
+def process_webhook_payload(payload):
+    t = Ticket().from_evand(payload)
+    logger.debug('Ticket saved', extra={'ticket_id': t.ticket_id})
+    return t
+
+
+def message_payload(message: WebHookMessage):
+    '''
+    The stored payload, nested or in the flat form data of older messages.
+    ``extract_ticket`` reads both.
+    '''
+    return message.payload or {}
+
+
+def parse_ticket(payload):
+    '''Build an unsaved Ticket from a stored payload.'''
+    return Ticket().from_evand(payload or {}, commit=False)
+
+
+def claim_batch(batch_size, shard=0, shards=1, lease=None):
+    '''
+    Pending messages that are due, oldest first. When several workers drain
+    the queue each one only sees ``id % shards == shard``.
+
+    The messages are leased in a short transaction of their own: their
+    ``next_attempt_at`` is pushed WEBHOOK_LEASE_SECONDS ahead, so other
+    workers skip them while they are processed, and they are due again
+    should this worker die before recording the outcome.
+    '''
+    if lease is None:
+        lease = settings.WEBHOOK_LEASE_SECONDS
+    now = timezone.now()
+    qs = WebHookMessage.objects.filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+        status=WebHookMessage.Status.PENDING,
+    )
+    if shards > 1:
+        qs = qs.annotate(shard=Mod('id', shards)).filter(shard=shard)
+    if connection.features.has_select_for_update_skip_locked:
+        qs = qs.select_for_update(skip_locked=True)
+    with transaction.atomic():
+        messages = list(qs.order_by('id')[:batch_size])
+        WebHookMessage.objects.filter(
+            id__in=[message.id for message in messages]).update(
+            next_attempt_at=now + timedelta(seconds=lease))
+    return messages
+
+
+def process_message(message: WebHookMessage, max_attempts=None):
+    '''
+    Run a single message through ``process_webhook_payload`` and record the
+    outcome on it. Returns True if the ticket was written.
+    '''
+    if max_attempts is None:
+        max_attempts = settings.WEBHOOK_MAX_ATTEMPTS
+    message.attempts += 1
+    try:
+        with transaction.atomic():
+            process_webhook_payload(message_payload(message))
+    except Exception as e:
+        record_failure(message, e, max_attempts)
+        message.save(update_fields=[
+            'attempts', 'status', 'next_attempt_at', 'last_error'])
+        return False
+
+    record_success(message)
+    message.save(update_fields=[
+        'attempts', 'status', 'processed_at', 'next_attempt_at', 'last_error'])
+    return True
+
+
+def record_failure(message: WebHookMessage, error, max_attempts):
+    '''
+    Schedule the retry of a failed attempt or dead-letter the message, call
+    it from the ``except`` block. The message is not saved.
+    '''
+    message.last_error = f'{type(error).__name__}: {error}'
+    if message.attempts >= max_attempts:
+        message.status = WebHookMessage.Status.DEAD
+        message.next_attempt_at = None
+    else:
+        message.next_attempt_at = timezone.now() + timedelta(
+            seconds=settings.WEBHOOK_RETRY_DELAY * 2 ** (message.attempts - 1))
+    metrics.increment('webhook_failed')
+    log = {'message_id': message.id, 'attempts': message.attempts}
+    if message.status == WebHookMessage.Status.DEAD:
+        metrics.increment('webhook_dead')
+        logger.error('Webhook message dead-lettered', exc_info=True,
+            extra=log)
+    else:
+        logger.warning('Webhook message failed, will retry',
+            exc_info=True, extra=log)
+
+
+def record_success(message: WebHookMessage):
+    message.status = WebHookMessage.Status.PROCESSED
+    message.processed_at = timezone.now()
+    message.next_attempt_at = None
+    message.last_error = ''
+    metrics.increment('webhook_processed')
+
+
+def process_new_messages(messages, max_attempts=None):
+    '''
+    ``process_message`` for a batch of messages not saved yet: the tickets
+    of all of them are upserted at once and the outcomes are recorded on the
+    messages, for the caller to insert in the same transaction. An error
+    writing the tickets is raised so that none of the batch is stored.
+    '''
+    if max_attempts is None:
+        max_attempts = settings.WEBHOOK_MAX_ATTEMPTS
+    parsed, tickets = [], []
+    for message in messages:
+        message.attempts += 1
+        try:
+            tickets.append(parse_ticket(message_payload(message)))
+        except Exception as e:
+            record_failure(message, e, max_attempts)
+        else:
+            parsed.append(message)
+    Ticket.objects.upsert(tickets)
+    for message in parsed:
+        record_success(message)
+
+
+def drain(batch_size=100, shard=0, shards=1, max_attempts=None):
+    '''
+    Process one batch of pending messages.
+    Returns a ``(processed, failed)`` tuple.
+    '''
+    processed = failed = 0
+    # One transaction per message, so the write lock is not held across the
+    # batch and the hook's inserts are not kept waiting.
+    for message in claim_batch(batch_size, shard, shards):
+        with transaction.atomic():
+            if process_message(message, max_attempts):
+                processed += 1
+            else:
+                failed += 1
+    return processed, failed
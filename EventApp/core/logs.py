@@ -0,0 +1,63 @@
+'''
+Logging for the ingest path: one JSON object per line, written from a
+background thread so that requests never block on stdout. Used by LOGGING
+in the settings.
+'''
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has, anything else was passed in ``extra``.
+RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class BackgroundStreamHandler(QueueHandler):
+    '''
+    Queue the records and write them to ``stream`` (stderr by default) on a
+    listener thread. The formatter is applied on that thread too.
+    '''
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.handler = logging.StreamHandler(stream or sys.stderr)
+        self.listener = QueueListener(self.queue, self.handler)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def setFormatter(self, fmt):
+        self.handler.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Only what cannot cross threads is resolved here: the arguments and
+        # the traceback.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
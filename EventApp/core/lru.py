@@ -0,0 +1,45 @@
+'''
+Bounded in-process caches, shared by the threads of a worker. See
+``core.catalog`` and ``core.dedup``.
+'''
+import threading
+from collections import OrderedDict
+
+
+class LRU:
+    '''Mapping of at most ``size`` items, the least recently used go first.'''
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                return True
+        return False
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def add(self, key):
+        '''Remember ``key`` without a value, for set-like use.'''
+        self.update({key: None})
+
+    def update(self, items):
+        with self.lock:
+            for key, value in items.items():
+                self.items[key] = value
+                self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.archive import archive_expired
+
+
+class Command(BaseCommand):
+    help = ('Move webhook messages older than the retention window to '
+            'compressed daily files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=None,
+            help='Archive root. Defaults to WEBHOOK_ARCHIVE_DIR.')
+        parser.add_argument('--days', type=int, default=None,
+            help='Retention window. Defaults to WEBHOOK_RETENTION_DAYS.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--time-budget', type=float, default=None,
+            help='Stop after this many seconds.')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        archived = archive_expired(options['directory'], options['days'],
+            options['chunk_size'], options['time_budget'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} messages in {time.monotonic() - start:.2f}s.'))
@@ -0,0 +1,189 @@
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.ingest import parse_ticket
+from core.models import Ticket
+
+FORMATS = ('csv', 'json', 'jsonl')
+BLANK = re.compile(r'\s*')
+SEPARATOR = re.compile(r'[\s,]*')
+
+
+def column_key(column):
+    '''
+    Form key of a CSV column: ``data[ticket][data][price]`` is kept, and the
+    dotted ``ticket.data.price`` or a bare ``email`` are taken relative to
+    ``data`` like the paths of ``core.evand.TICKET_MAPPING``.
+    '''
+    column = column.strip()
+    if '[' in column:
+        return column
+    return 'data' + ''.join(f'[{token}]' for token in column.split('.'))
+
+
+def as_payload(item):
+    '''A JSON item as a payload for ``extract_ticket``.'''
+    if 'data' in item or any('[' in key for key in item):
+        return item
+    # The attendee object itself, without the webhook envelope.
+    return {'data': item}
+
+
+def read_csv(f):
+    reader = csv.reader(f)
+    keys = [column_key(column) for column in next(reader, [])]
+    for row in reader:
+        yield dict(zip(keys, row))
+
+
+def read_jsonl(f):
+    for line in f:
+        if line.strip():
+            yield as_payload(json.loads(line))
+
+
+def read_json(f, size=1 << 16):
+    '''Items of a top-level JSON array, decoded as the file is read.'''
+    decoder = json.JSONDecoder()
+    buffer = f.read(size)
+    pos = BLANK.match(buffer).end()
+    if buffer[pos:pos + 1] != '[':
+        raise CommandError('A JSON export must be an array.')
+    pos += 1
+    while True:
+        pos = SEPARATOR.match(buffer, pos).end()
+        if buffer[pos:pos + 1] == ']':
+            return
+        try:
+            if pos == len(buffer):
+                raise ValueError
+            item, pos = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            # The item continues past the buffer.
+            more = f.read(size)
+            if not more:
+                raise CommandError('Invalid or truncated JSON export.')
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        yield as_payload(item)
+
+
+READERS = {'csv': read_csv, 'json': read_json, 'jsonl': read_jsonl}
+
+
+def _parse(payloads):
+    '''A ticket and None per payload, or None and why it failed.'''
+    results = []
+    for payload in payloads:
+        try:
+            results.append((parse_ticket(payload), None))
+        except Exception as e:
+            results.append((None, f'{type(e).__name__}: {e}'))
+    return results
+
+
+def split(items, parts):
+    size = -(-len(items) // parts)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class Command(BaseCommand):
+    help = 'Import tickets from an Evand CSV, JSON or JSON Lines export.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Export file, optionally gzipped.')
+        parser.add_argument('--format', choices=FORMATS,
+            help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+            help='Tickets per write transaction.')
+        parser.add_argument('--workers', type=int, default=None,
+            help='Parser processes, one less than the CPUs by default. '
+                 '0 parses in this process.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        name = path[:-3] if path.endswith('.gz') else path
+        format = options['format'] or os.path.splitext(name)[1][1:].lower()
+        if format == 'ndjson':
+            format = 'jsonl'
+        if format not in FORMATS:
+            raise CommandError(f'Unknown format of {path}, use --format.')
+
+        workers = options['workers']
+        if workers is None:
+            # The remaining CPU is this process writing to the database.
+            workers = (os.cpu_count() or 1) - 1
+        chunk_size = options['chunk_size']
+        size = os.path.getsize(path)
+
+        with open(path, 'rb') as raw:
+            stream = gzip.GzipFile(fileobj=raw) if path.endswith('.gz') \
+                else raw
+            text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+            rows = READERS[format](text)
+            executor = workers and ProcessPoolExecutor(workers,
+                initializer=django.setup)
+            try:
+                self.run(rows, chunk_size, executor, workers,
+                    lambda: raw.tell() / size if size else 1)
+            finally:
+                if executor:
+                    executor.shutdown()
+
+    def run(self, rows, chunk_size, executor, workers, progress):
+        '''
+        Parse the next chunk in the workers while the current one is
+        written, so parsing and the database overlap.
+        '''
+        chunks = iter(lambda: list(islice(rows, chunk_size)), [])
+        in_flight = deque()
+        done = written = failed = 0
+        start = time.monotonic()
+
+        def submit():
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            if executor:
+                in_flight.append([executor.submit(_parse, part)
+                    for part in split(chunk, workers)])
+            else:
+                in_flight.append(_parse(chunk))
+
+        submit()
+        while in_flight:
+            submit()
+            parts = in_flight.popleft()
+            results = [result for part in parts for result in part.result()] \
+                if executor else parts
+            parsed = []
+            for row, (ticket, error) in enumerate(results, done + 1):
+                if error is None:
+                    parsed.append(ticket)
+                else:
+                    self.stderr.write(f'Row {row} not imported: {error}')
+            with transaction.atomic():
+                written += Ticket.objects.upsert(parsed)
+            failed += len(results) - len(parsed)
+            done += len(results)
+
+            elapsed = time.monotonic() - start
+            self.stdout.write(
+                f'{progress():6.1%} {done} rows, {written} tickets written, '
+                f'{failed} failed, {done / elapsed:.0f} rows/s')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {written} tickets from {done} rows in '
+            f'{time.monotonic() - start:.2f}s.'))
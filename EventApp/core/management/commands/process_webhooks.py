@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from core.ingest import drain
+
+
+class Command(BaseCommand):
+    help = 'Drain pending webhook messages into tickets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+            help='Number of worker threads.')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=None,
+            help='Attempts before a message is dead-lettered. '
+                 'Defaults to WEBHOOK_MAX_ATTEMPTS.')
+        parser.add_argument('--sleep', type=float, default=1.0,
+            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+            help='Exit as soon as the queue is empty.')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        self.stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self.work, shard, workers, options)
+                for shard in range(workers)
+            ]
+            try:
+                while wait(futures, timeout=1).not_done:
+                    pass
+            except KeyboardInterrupt:
+                self.stop.set()
+
+        processed = failed = 0
+        for future in futures:
+            p, f = future.result()
+            processed += p
+            failed += f
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} messages, {failed} failed.'))
+
+    def work(self, shard, shards, options):
+        processed = failed = 0
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                p, f = drain(options['batch_size'], shard, shards,
+                    options['max_attempts'])
+                processed += p
+                failed += f
+                if p + f == 0:
+                    if options['once']:
+                        break
+                    self.stop.wait(options['sleep'])
+        finally:
+            connections.close_all()
+        return processed, failed
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.retention import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete webhook messages older than the retention window.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+            help='Retention window. Defaults to WEBHOOK_RETENTION_DAYS.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--time-budget', type=float, default=None,
+            help='Stop after this many seconds.')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        deleted = purge_expired(options['days'], options['chunk_size'],
+            options['time_budget'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {deleted} messages in {time.monotonic() - start:.2f}s.'))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import EventStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute per event sales stats from the tickets table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_ids', nargs='*',
+            help='Only rebuild these events. Defaults to all of them.')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        EventStats.objects.rebuild(options['event_ids'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt event stats in {time.monotonic() - start:.2f}s.'))
@@ -0,0 +1,138 @@
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time as dt_time
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.archive import read_archive
+from core.ingest import parse_ticket
+from core.models import WebHookMessage, Ticket
+
+
+def _parse(payload):
+    '''The ticket of ``payload`` and None, or None and why it failed.'''
+    try:
+        return parse_ticket(payload), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+def _parse_datetime(value):
+    '''
+    An ISO datetime, or a date meaning its midnight. Naive values are in the
+    default time zone.
+    '''
+    if value is None:
+        return None
+    try:
+        date = parse_datetime(value)
+        if date is None:
+            day = parse_date(value)
+            date = day and datetime.combine(day, dt_time())
+    except ValueError:
+        date = None
+    if date is None:
+        raise CommandError(f'Invalid date: {value}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.get_default_timezone())
+    return date
+
+
+class Command(BaseCommand):
+    help = 'Rebuild tickets from stored webhook messages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since',
+            help='ISO date or datetime, received_at lower bound.')
+        parser.add_argument('--until',
+            help='ISO date or datetime, received_at upper bound.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+            help='Messages per write transaction.')
+        parser.add_argument('--workers', type=int, default=None,
+            help='Parser processes. 0 parses in this process.')
+        parser.add_argument('--archive', nargs='+', metavar='PATH',
+            help='Replay archived messages from these files or directories '
+                 '(see archive_webhooks) instead of the database.')
+        parser.add_argument('--checkpoint',
+            help='File recording the last replayed message id. '
+                 'An existing checkpoint resumes the replay.')
+
+    def handle(self, *args, **options):
+        since = _parse_datetime(options['since'])
+        until = _parse_datetime(options['until'])
+        checkpoint = options['checkpoint'] and Path(options['checkpoint'])
+        last_id = None
+        if checkpoint and checkpoint.exists():
+            last_id = json.loads(checkpoint.read_text())['last_id']
+            self.stdout.write(f'Resuming after message {last_id}.')
+
+        chunk_size = options['chunk_size']
+        if options['archive']:
+            # Archives are ordered by received_at, which follows the ids.
+            messages = (
+                (record['id'], record['payload'])
+                for record in read_archive(options['archive'], since, until)
+                if last_id is None or record['id'] > last_id
+            )
+            total = None
+        else:
+            qs = WebHookMessage.objects.order_by('id')
+            if since:
+                qs = qs.filter(received_at__gte=since)
+            if until:
+                qs = qs.filter(received_at__lt=until)
+            if last_id is not None:
+                qs = qs.filter(id__gt=last_id)
+            total = qs.count()
+            messages = qs.values_list('id', 'payload').iterator(
+                chunk_size=chunk_size)
+
+        executor = None
+        if options['workers'] != 0:
+            executor = ProcessPoolExecutor(options['workers'],
+                initializer=django.setup)
+        done = written = failed = 0
+        start = time.monotonic()
+        try:
+            while True:
+                chunk = [m for _, m in zip(range(chunk_size), messages)]
+                if not chunk:
+                    break
+                payloads = [payload for _, payload in chunk]
+                if executor:
+                    results = list(executor.map(_parse, payloads,
+                        chunksize=max(1, chunk_size // 16)))
+                else:
+                    results = [_parse(payload) for payload in payloads]
+
+                parsed = []
+                for (message_id, _), (ticket, error) in zip(chunk, results):
+                    if error is None:
+                        parsed.append(ticket)
+                    else:
+                        self.stderr.write(
+                            f'Message {message_id} not replayed: {error}')
+                with transaction.atomic():
+                    written += Ticket.objects.upsert(parsed)
+                failed += len(chunk) - len(parsed)
+                done += len(chunk)
+                if checkpoint:
+                    checkpoint.write_text(json.dumps({'last_id': chunk[-1][0]}))
+
+                elapsed = time.monotonic() - start
+                progress = done if total is None else f'{done}/{total}'
+                self.stdout.write(
+                    f'{progress} messages, {written} tickets written, '
+                    f'{failed} failed, {done / elapsed:.0f} msg/s')
+        finally:
+            if executor:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {done} messages in {time.monotonic() - start:.2f}s.'))
@@ -0,0 +1,235 @@
+'''
+Counters and stage timers of the ingest path, rendered in the Prometheus
+text format by ``core.hook.metrics_view``.
+
+Each process counts in memory and writes its totals to a file of its own in
+METRICS_DIR, which the endpoint sums, so a scrape sees every gunicorn worker
+and the timings of management commands whichever worker answers it. Files
+of processes that exited are folded into ``exited.json``, keeping the
+counters monotonic.
+'''
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+PREFIX = 'eventapp'
+# Upper bounds in seconds of the stage duration histogram.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10)
+EXITED = 'exited.json'
+
+_lock = threading.Lock()
+_counters = Counter()
+# stage: [count per bucket with +Inf last, count, sum]
+_timers = {}
+# This process's file in METRICS_DIR, named ``<pid>-<random>.json`` so that
+# a reused pid does not overwrite the file of an exited process.
+_file = f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+_flushed_at = 0.0
+
+
+def increment(name, value=1):
+    with _lock:
+        _counters[name] += value
+    flush()
+
+
+def counters():
+    '''This process's counters.'''
+    with _lock:
+        return dict(_counters)
+
+
+def observe(stage, seconds):
+    with _lock:
+        timer = _timers.get(stage)
+        if timer is None:
+            timer = _timers[stage] = [[0] * (len(BUCKETS) + 1), 0, 0.0]
+        timer[0][bisect_left(BUCKETS, seconds)] += 1
+        timer[1] += 1
+        timer[2] += seconds
+    flush()
+
+
+@contextmanager
+def timer(stage):
+    '''Record how long the block takes under ``stage``.'''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def timers():
+    '''``{stage: (count, sum)}`` of this process.'''
+    with _lock:
+        return {stage: (t[1], t[2]) for stage, t in _timers.items()}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def _forked():
+    '''A forked worker starts from zero, its parent reports what it counted.'''
+    global _lock, _file, _flushed_at
+    _lock = threading.Lock()
+    _counters.clear()
+    _timers.clear()
+    _file = f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+    _flushed_at = 0.0
+
+
+os.register_at_fork(after_in_child=_forked)
+
+
+def snapshot():
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'timers': {stage: [list(t[0]), t[1], t[2]]
+                for stage, t in _timers.items()},
+        }
+
+
+def write(path, data):
+    '''Replace ``path`` at once, readers never see half a file.'''
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def flush(force=False):
+    '''
+    Write this process's metrics to METRICS_DIR, at most every
+    METRICS_FLUSH_INTERVAL seconds unless ``force``.
+    '''
+    global _flushed_at
+    directory = settings.METRICS_DIR
+    now = time.monotonic()
+    if not directory or (not force
+            and now - _flushed_at < settings.METRICS_FLUSH_INTERVAL):
+        return
+    _flushed_at = now
+    data = snapshot()
+    if data['counters'] or data['timers']:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        write(directory / _file, data)
+
+
+@atexit.register
+def _exit():
+    try:
+        flush(force=True)
+    except Exception:
+        pass
+
+
+def merge(total, data):
+    for name, value in data['counters'].items():
+        total['counters'][name] = total['counters'].get(name, 0) + value
+    for stage, (buckets, count, seconds) in data['timers'].items():
+        timer = total['timers'].setdefault(stage,
+            [[0] * (len(BUCKETS) + 1), 0, 0.0])
+        timer[0] = [a + b for a, b in zip(timer[0], buckets)]
+        timer[1] += count
+        timer[2] += seconds
+    return total
+
+
+def running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def fold_exited(directory):
+    '''Fold the files of processes that exited into ``exited.json``.'''
+    exited = [path for path in directory.glob('*-*.json')
+        if not running(int(path.name.split('-')[0]))]
+    if not exited:
+        return
+    total = read(directory / EXITED) if (directory / EXITED).exists() \
+        else {'counters': {}, 'timers': {}}
+    for path in exited:
+        merge(total, read(path))
+    write(directory / EXITED, total)
+    for path in exited:
+        path.unlink()
+
+
+def collect():
+    '''The metrics of every process writing to METRICS_DIR.'''
+    directory = settings.METRICS_DIR
+    if not directory:
+        return snapshot()
+    flush(force=True)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    total = {'counters': {}, 'timers': {}}
+    # Scrapes one at a time, so that none reads a file another one is
+    # folding into exited.json.
+    with open(directory / '.lock', 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            fold_exited(directory)
+        for path in directory.glob('*.json'):
+            merge(total, read(path))
+    return total
+
+
+def render():
+    '''All metrics in the Prometheus text exposition format.'''
+    data = collect()
+    counts = sorted(data['counters'].items())
+    stages = sorted((stage, *t) for stage, t in data['timers'].items())
+
+    lines = []
+    for name, value in counts:
+        lines += [
+            f'# TYPE {PREFIX}_{name}_total counter',
+            f'{PREFIX}_{name}_total {value}',
+        ]
+    if stages:
+        name = f'{PREFIX}_stage_duration_seconds'
+        lines.append(f'# TYPE {name} histogram')
+    for stage, buckets, count, total in stages:
+        cumulative = 0
+        for bound, value in zip(BUCKETS + ('+Inf',), buckets):
+            cumulative += value
+            lines.append(
+                f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines += [
+            f'{name}_count{{stage="{stage}"}} {count}',
+            f'{name}_sum{{stage="{stage}"}} {total:.6f}',
+        ]
+    return '\n'.join(lines) + '\n'
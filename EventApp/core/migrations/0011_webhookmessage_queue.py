@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_auto_20220511_2144'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookmessage',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='webhookmessage',
+            name='last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='webhookmessage',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, help_text='Pending message is not retried before this time.', null=True),
+        ),
+        migrations.AddField(
+            model_name='webhookmessage',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # Messages stored before the queue existed were processed inline.
+        migrations.AddField(
+            model_name='webhookmessage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('dead', 'Dead')], default='processed', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='webhookmessage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('dead', 'Dead')], default='pending', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='webhookmessage',
+            index=models.Index(fields=['status', 'id'], name='core_webhoo_status_1d55d4_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:21
+
+from django.db import migrations, models, transaction
+from django.db.models import Count
+
+
+CHUNK_SIZE = 500
+
+
+def collapse_duplicate_tickets(apps, schema_editor):
+    '''
+    Keep the latest row (by updated_at, then id) of every ticket_id and move
+    attendees of the other rows onto it. Works through duplicated ticket_ids
+    in chunks, each in its own transaction.
+    '''
+    Ticket = apps.get_model('core', 'Ticket')
+    Attendee = apps.get_model('core', 'Attendee')
+    db = schema_editor.connection.alias
+
+    duplicated = Ticket.objects.using(db).filter(
+        ticket_id__isnull=False,
+    ).values('ticket_id').annotate(
+        n=Count('id'),
+    ).filter(n__gt=1).order_by('ticket_id').values_list('ticket_id', flat=True)
+
+    last = None
+    while True:
+        qs = duplicated if last is None else duplicated.filter(
+            ticket_id__gt=last)
+        chunk = list(qs[:CHUNK_SIZE])
+        if not chunk:
+            break
+        last = chunk[-1]
+
+        with transaction.atomic(using=db):
+            groups = {}
+            for pk, ticket_id in Ticket.objects.using(db).filter(
+                ticket_id__in=chunk,
+            ).order_by('ticket_id', 'updated_at', 'id').values_list(
+                'id', 'ticket_id'):
+                groups.setdefault(ticket_id, []).append(pk)
+
+            stale = []
+            for pks in groups.values():
+                keep = pks.pop()
+                Attendee.objects.using(db).filter(
+                    ticket_id__in=pks).update(ticket_id=keep)
+                stale.extend(pks)
+            Ticket.objects.using(db).filter(id__in=stale).delete()
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_webhookmessage_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_duplicate_tickets,
+            migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='ticket',
+            name='ticket_id',
+            field=models.CharField(blank=True, max_length=30, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,82 @@
+from django.db import migrations
+
+
+TICKET_TEXT = (
+    "coalesce({p}email, '') || ' ' || coalesce({p}mobile, '') || ' ' || "
+    "coalesce({p}ticket_id, '') || ' ' || coalesce({p}event_id, '') || ' ' || "
+    "coalesce({p}first_name, '') || ' ' || coalesce({p}title, '') || ' ' || "
+    "coalesce({p}last_name, '')"
+)
+PAYLOAD_TEXT = (
+    "(SELECT group_concat(value, ' ') FROM json_tree({p}payload) "
+    "WHERE type NOT IN ('object', 'array'))"
+)
+
+
+def sqlite_triggers(table, text):
+    '''Triggers keeping ``{table}_fts`` in sync, safe to re-run.'''
+    return [
+        f"DROP TRIGGER IF EXISTS {table}_fts_{action}"
+        for action in ('insert', 'update', 'delete')
+    ] + [
+        f"CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {table}_fts (rowid, body) "
+        f"VALUES (new.id, {text.format(p='new.')}); END",
+        f"CREATE TRIGGER {table}_fts_update AFTER UPDATE ON {table} BEGIN "
+        f"DELETE FROM {table}_fts WHERE rowid = old.id; "
+        f"INSERT INTO {table}_fts (rowid, body) "
+        f"VALUES (new.id, {text.format(p='new.')}); END",
+        f"CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+        f"DELETE FROM {table}_fts WHERE rowid = old.id; END",
+    ]
+
+
+# SQLite drops the triggers when a later migration rebuilds the table,
+# core.search.sync_sqlite_index re-creates them after migrate.
+SQLITE_FORWARD = []
+for table, text in (('core_ticket', TICKET_TEXT),
+        ('core_webhookmessage', PAYLOAD_TEXT)):
+    SQLITE_FORWARD += [
+        f"CREATE VIRTUAL TABLE {table}_fts USING fts5(body)",
+        f"INSERT INTO {table}_fts (rowid, body) "
+        f"SELECT id, {text.format(p='')} FROM {table}",
+    ] + sqlite_triggers(table, text)
+
+SQLITE_BACKWARD = []
+for table in ('core_ticket', 'core_webhookmessage'):
+    SQLITE_BACKWARD += [
+        f"DROP TRIGGER IF EXISTS {table}_fts_{action}"
+        for action in ('insert', 'update', 'delete')
+    ] + [f"DROP TABLE IF EXISTS {table}_fts"]
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX core_ticket_search_idx ON core_ticket USING gin "
+    f"(to_tsvector('simple', {TICKET_TEXT.format(p='')}))",
+    "CREATE INDEX core_webhookmessage_search_idx ON core_webhookmessage "
+    "USING gin (to_tsvector('simple', payload))",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS core_ticket_search_idx",
+    "DROP INDEX IF EXISTS core_webhookmessage_search_idx",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_ticket_unique_ticket_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['updated_at', 'created_at'], name='core_ticket_updated_38a640_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['event_id', 'updated_at', 'created_at'], name='core_ticket_event_i_334fb8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['type', 'updated_at', 'created_at'], name='core_ticket_type_08f953_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['canceled', 'updated_at', 'created_at'], name='core_ticket_cancele_33d194_idx'),
+        ),
+    ]
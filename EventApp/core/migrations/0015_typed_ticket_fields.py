@@ -0,0 +1,116 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+INT_MAX = 2 ** 31 - 1
+BIGINT_MAX = 2 ** 63 - 1
+
+
+def to_int(value, minimum, maximum):
+    '''
+    The number, or None when it is blank, not a number (``'nan'``,
+    ``'inf'``) or outside the range of the column.
+    '''
+    value = (value or '').strip().replace(',', '')
+    if not value:
+        return None
+    try:
+        number = int(Decimal(value))
+    except (InvalidOperation, ValueError, OverflowError):
+        return None
+    return number if minimum <= number <= maximum else None
+
+
+def to_bool(value):
+    return (value or '').strip().lower() in ('true', '1', 'yes', 'on')
+
+
+def copy_typed_values(apps, schema_editor):
+    '''
+    Fill the typed columns from the old CharFields, walking the table by id
+    in batches so each transaction stays short and memory stays flat.
+    Unparsable numbers, and negative prices or numbers too large for their
+    column, become NULL.
+    '''
+    Ticket = apps.get_model('core', 'Ticket')
+    db = schema_editor.connection.alias
+    last = 0
+    while True:
+        rows = list(Ticket.objects.using(db).filter(id__gt=last).order_by(
+            'id').values_list('id', 'price', 'available_count', 'canceled')[
+            :BATCH_SIZE])
+        if not rows:
+            break
+        last = rows[-1][0]
+        with transaction.atomic(using=db):
+            Ticket.objects.using(db).bulk_update([
+                Ticket(id=id, price_typed=to_int(price, 0, BIGINT_MAX),
+                    available_count_typed=to_int(available_count,
+                        -INT_MAX - 1, INT_MAX),
+                    canceled_typed=to_bool(canceled))
+                for id, price, available_count, canceled in rows
+            ], ['price_typed', 'available_count_typed', 'canceled_typed'])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0014_ticket_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='price_typed',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='available_count_typed',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='canceled_typed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(copy_typed_values, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='ticket',
+            name='core_ticket_cancele_33d194_idx',
+        ),
+        migrations.RemoveField(
+            model_name='ticket',
+            name='price',
+        ),
+        migrations.RemoveField(
+            model_name='ticket',
+            name='available_count',
+        ),
+        migrations.RemoveField(
+            model_name='ticket',
+            name='canceled',
+        ),
+        migrations.RenameField(
+            model_name='ticket',
+            old_name='price_typed',
+            new_name='price',
+        ),
+        migrations.RenameField(
+            model_name='ticket',
+            old_name='available_count_typed',
+            new_name='available_count',
+        ),
+        migrations.RenameField(
+            model_name='ticket',
+            old_name='canceled_typed',
+            new_name='canceled',
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['canceled', 'updated_at', 'created_at'], name='core_ticket_cancele_33d194_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:37
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.utils.timezone
+
+
+def build_stats(apps, schema_editor):
+    Ticket = apps.get_model('core', 'Ticket')
+    EventStats = apps.get_model('core', 'EventStats')
+    db = schema_editor.connection.alias
+    rows = Ticket.objects.using(db).values('event_id', 'type').annotate(
+        sold_count=Count('id', filter=Q(canceled=False)),
+        canceled_count=Count('id', filter=Q(canceled=True)),
+        revenue_sum=Sum('price', filter=Q(canceled=False)),
+    ).order_by()
+    EventStats.objects.using(db).bulk_create([
+        EventStats(event_id=row['event_id'] or '', type=row['type'] or '',
+            sold=row['sold_count'], canceled=row['canceled_count'],
+            revenue=row['revenue_sum'] or 0)
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_typed_ticket_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(blank=True, default='', max_length=30)),
+                ('type', models.CharField(blank=True, default='', max_length=20)),
+                ('sold', models.IntegerField(default=0)),
+                ('canceled', models.IntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'event stats',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='eventstats',
+            constraint=models.UniqueConstraint(fields=('event_id', 'type'), name='core_eventstats_event_type'),
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_eventstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookmessage',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of the payload, see core.dedup.', max_length=64, null=True, unique=True),
+        ),
+    ]
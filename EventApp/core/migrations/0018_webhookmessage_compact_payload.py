@@ -0,0 +1,73 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:42
+
+import core.models
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+
+def nest(payload):
+    '''
+    Flat form data (``{'data[ticket][data][price]': ['10']}``) to nested
+    dicts, as core.evand.evaluate_evand_fucking_data does on new messages.
+    '''
+    tree = {}
+    for key, values in payload.items():
+        i = key.find('[')
+        if i <= 0 or not key.endswith(']'):
+            tokens = [key]
+        else:
+            tokens = [key[:i], *key[i + 1:-1].split('][')]
+        multi = tokens[-1] == '' and len(tokens) > 1
+        if multi:
+            tokens.pop()
+        node = tree
+        for token in tokens[:-1]:
+            if not isinstance(node.get(token), dict):
+                node[token] = {}
+            node = node[token]
+        if not isinstance(values, list):
+            values = [values]
+        node[tokens[-1]] = values if multi else (values[-1] if values else None)
+    return tree
+
+
+def is_flat(payload):
+    return isinstance(payload, dict) and any('[' in key for key in payload)
+
+
+def nest_payloads(apps, schema_editor):
+    '''Rewrite flat payloads nested, in batches by id.'''
+    WebHookMessage = apps.get_model('core', 'WebHookMessage')
+    db = schema_editor.connection.alias
+    last = 0
+    while True:
+        messages = list(WebHookMessage.objects.using(db).filter(
+            id__gt=last).order_by('id').only('id', 'payload')[:BATCH_SIZE])
+        if not messages:
+            break
+        last = messages[-1].id
+        changed = []
+        for message in messages:
+            if is_flat(message.payload):
+                message.payload = nest(message.payload)
+                changed.append(message)
+        with transaction.atomic(using=db):
+            WebHookMessage.objects.using(db).bulk_update(changed, ['payload'])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0017_webhookmessage_content_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='webhookmessage',
+            name='payload',
+            field=models.JSONField(default=None, encoder=core.models.CompactJSONEncoder, null=True),
+        ),
+        migrations.RunPython(nest_payloads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,165 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:01
+
+from importlib import import_module
+
+from django.db import migrations, models, transaction
+from django.db.models import Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+search_index = import_module('core.migrations.0013_search_index')
+
+BATCH_SIZE = 1000
+
+# The event and title now live in the catalog, see core.search. The SQLite
+# triggers and index follow core.search.sync_sqlite_index after migrate.
+TICKET_TEXT = (
+    "coalesce({p}email, '') || ' ' || coalesce({p}mobile, '') || ' ' || "
+    "coalesce({p}ticket_id, '') || ' ' || coalesce({p}first_name, '') || "
+    "' ' || coalesce({p}last_name, '')"
+)
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX core_ticket_search_idx ON core_ticket USING gin "
+    f"(to_tsvector('simple', {TICKET_TEXT.format(p='')}))",
+]
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS core_ticket_search_idx",
+]
+
+
+def backfill_catalog(apps, schema_editor):
+    '''
+    One Event per event_id and one TicketType per (event_id, type) of the
+    tickets, titled after the last stored ticket of the type, then point
+    the tickets at them in batches by id.
+    '''
+    Event = apps.get_model('core', 'Event')
+    TicketType = apps.get_model('core', 'TicketType')
+    Ticket = apps.get_model('core', 'Ticket')
+    db = schema_editor.connection.alias
+    tickets = Ticket.objects.using(db).exclude(evand_event_id=None)
+
+    types = list(tickets.values('evand_event_id', 'type').annotate(
+        last=Max('id')).order_by().values_list('evand_event_id', 'type',
+        'last'))
+    titles = {}
+    for i in range(0, len(types), BATCH_SIZE):
+        titles.update((id, (title, description))
+            for id, title, description in tickets.filter(id__in=[
+                last for _, _, last in types[i:i + BATCH_SIZE]
+            ]).values_list('id', 'title', 'description'))
+
+    with transaction.atomic(using=db):
+        Event.objects.using(db).bulk_create([
+            Event(evand_id=event_id)
+            for event_id in sorted({event_id for event_id, _, _ in types})
+        ], batch_size=BATCH_SIZE)
+        events = dict(Event.objects.using(db).values_list('evand_id', 'id'))
+        ticket_types = {}
+        for event_id, type, last in types:
+            title, description = titles[last]
+            # Tickets with and without a type of '' share one.
+            ticket_types.setdefault((event_id, type or ''), TicketType(
+                event_id=events[event_id], type=type or '', title=title,
+                description=description))
+        TicketType.objects.using(db).bulk_create(ticket_types.values(),
+            batch_size=BATCH_SIZE)
+
+    event = Event.objects.using(db).filter(
+        evand_id=OuterRef('evand_event_id')).values('id')[:1]
+    ticket_type = TicketType.objects.using(db).filter(
+        event__evand_id=OuterRef('evand_event_id'),
+        type=Coalesce(OuterRef('type'), Value(''))).values('id')[:1]
+    last = tickets.aggregate(last=Max('id'))['last'] or 0
+    for start in range(0, last, BATCH_SIZE):
+        tickets.filter(id__gt=start, id__lte=start + BATCH_SIZE).update(
+            event=Subquery(event), ticket_type=Subquery(ticket_type))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0018_webhookmessage_compact_payload'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            search_index.run({'postgresql': POSTGRES_DROP}),
+            migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('evand_id', models.CharField(max_length=30, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TicketType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(blank=True, default='', max_length=20)),
+                ('title', models.CharField(blank=True, max_length=50, null=True)),
+                ('description', models.CharField(blank=True, max_length=50, null=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ticket_types', to='core.event')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tickettype',
+            constraint=models.UniqueConstraint(fields=('event', 'type'), name='core_tickettype_event_type'),
+        ),
+        migrations.RemoveIndex(
+            model_name='ticket',
+            name='core_ticket_event_i_334fb8_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ticket',
+            name='core_ticket_type_08f953_idx',
+        ),
+        # Frees the event_id column for the foreign key.
+        migrations.RenameField(
+            model_name='ticket',
+            old_name='event_id',
+            new_name='evand_event_id',
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='event',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='tickets', to='core.event'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='ticket_type',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='tickets', to='core.tickettype'),
+        ),
+        migrations.RunPython(backfill_catalog, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='ticket',
+            name='evand_event_id',
+        ),
+        migrations.RemoveField(
+            model_name='ticket',
+            name='type',
+        ),
+        migrations.RemoveField(
+            model_name='ticket',
+            name='title',
+        ),
+        migrations.RemoveField(
+            model_name='ticket',
+            name='description',
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['event', 'updated_at', 'created_at'], name='core_ticket_event_i_334fb8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['ticket_type', 'updated_at', 'created_at'], name='core_ticket_ticket__660af9_idx'),
+        ),
+        migrations.RunPython(
+            search_index.run({'postgresql': POSTGRES_FORWARD}),
+            migrations.RunPython.noop,
+        ),
+    ]
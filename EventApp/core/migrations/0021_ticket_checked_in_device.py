@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_ticket_checked_in_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='checked_in_device',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.utils import timezone
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, F, Q, Sum
 # from django.contrib.auth.models import PermissionsMixin, BaseUserManager, \
 #     Group
 # from django.contrib.auth.base_user import AbstractBaseUser
@@ -7,22 +9,63 @@ from django.utils.translation import gettext_lazy as _
 # from django.contrib.auth.validators import UnicodeUsernameValidator
 # from django.core.mail import send_mail
 # from django.core.exceptions import ImproperlyConfigured
+# from jdatetime import datetime as jdt
 from django.contrib.auth import get_user_model
+from django.dispatch import Signal
 
-from jdatetime import datetime as jdt
-from datetime import datetime
+from core import catalog, metrics
+from core.evand import extract_ticket
+
+
+# Sent with ``tickets`` once the upsert writing them commits, see
+# core.checkin.
+tickets_changed = Signal()
+
+
+class CompactJSONEncoder(DjangoJSONEncoder):
+    '''Serializes without the blanks after ``,`` and ``:``.'''
+
+    def __init__(self, *args, **kwargs):
+        kwargs['separators'] = (',', ':')
+        super().__init__(*args, **kwargs)
 
 
 class WebHookMessage(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        PROCESSED = 'processed', _('Processed')
+        DEAD = 'dead', _('Dead')
+
     received_at = models.DateTimeField(
         help_text=_('When message has received.'),
         default=timezone.now
     )
-    payload = models.JSONField(default=None, null=True)
+    # Nested by core.evand.evaluate_evand_fucking_data. Messages stored
+    # before 0018 may still hold the flat form data, extract_ticket reads
+    # both.
+    payload = models.JSONField(default=None, null=True,
+        encoder=CompactJSONEncoder)
+    content_hash = models.CharField(
+        help_text=_('SHA-256 of the payload, see core.dedup.'),
+        max_length=64, unique=True, blank=True, null=True
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(
+        help_text=_('Pending message is not retried before this time.'),
+        blank=True, null=True
+    )
+    last_error = models.TextField(blank=True, default='')
+    processed_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['received_at',]),
+            models.Index(fields=['status', 'id',]),
         ]
 
 
@@ -128,52 +171,380 @@ class WebHookMessage(models.Model):
 #         return jdt.fromgregorian(datetime=self.date_joined)
 
 
-class Ticket(models.Model):
-    event_id = models.CharField(max_length=30, blank=True, null=True)
-    ticket_id = models.CharField(max_length=30, blank=True, null=True)
-    type = models.CharField(max_length=20, blank=True, null=True)
+class EventStatsQuerySet(models.QuerySet):
+    def ticket_values(self, ticket):
+        return [*ticket.stats_key, ticket.canceled, ticket.price]
+
+    def add_delta(self, deltas, event_id, type, canceled, price, sign=1):
+        '''Add (or with ``sign=-1`` take back) one ticket's contribution.'''
+        delta = deltas.setdefault((event_id or '', type or ''), [0, 0, 0])
+        if canceled:
+            delta[1] += sign
+        else:
+            delta[0] += sign
+            delta[2] += sign * (price or 0)
+
+    def apply(self, deltas):
+        '''
+        Apply ``{(event_id, type): [sold, canceled, revenue]}`` as relative
+        updates, so concurrent writers do not overwrite each other's counts.
+        '''
+        for (event_id, type), (sold, canceled, revenue) in deltas.items():
+            if not (sold or canceled or revenue):
+                continue
+            changes = dict(
+                sold=F('sold') + sold,
+                canceled=F('canceled') + canceled,
+                revenue=F('revenue') + revenue,
+                updated_at=timezone.now(),
+            )
+            if self.filter(event_id=event_id, type=type).update(**changes):
+                continue
+            try:
+                with transaction.atomic(using=self.db):
+                    self.create(event_id=event_id, type=type, sold=sold,
+                        canceled=canceled, revenue=revenue)
+            except IntegrityError:
+                # Created by a concurrent writer in the meantime.
+                self.filter(event_id=event_id, type=type).update(**changes)
+
+    def rebuild(self, event_ids=None):
+        '''Recompute the stats from the tickets table.'''
+        tickets = Ticket.objects.using(self.db)
+        stats = self
+        if event_ids:
+            tickets = tickets.filter(event__evand_id__in=event_ids)
+            stats = stats.filter(event_id__in=event_ids)
+        rows = tickets.values('event__evand_id', 'ticket_type__type').annotate(
+            sold_count=Count('id', filter=Q(canceled=False)),
+            canceled_count=Count('id', filter=Q(canceled=True)),
+            revenue_sum=Sum('price', filter=Q(canceled=False)),
+        ).order_by()
+        with transaction.atomic(using=self.db):
+            stats.delete()
+            self.bulk_create([
+                EventStats(event_id=row['event__evand_id'] or '',
+                    type=row['ticket_type__type'] or '',
+                    sold=row['sold_count'],
+                    canceled=row['canceled_count'],
+                    revenue=row['revenue_sum'] or 0)
+                for row in rows
+            ])
+
+
+class EventStats(models.Model):
+    '''
+    Sales per event and ticket type, kept up to date by
+    ``TicketQuerySet.upsert``. Tickets deleted outside of it are only
+    reflected after ``manage.py rebuild_event_stats``.
+    '''
+    event_id = models.CharField(max_length=30, blank=True, default='')
+    type = models.CharField(max_length=20, blank=True, default='')
+    sold = models.IntegerField(default=0)
+    canceled = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    # Values of a stored ticket for add_delta, see ticket_values.
+    TICKET_FIELDS = ['event__evand_id', 'ticket_type__type', 'canceled',
+        'price']
+
+    objects = EventStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'event stats'
+        constraints = [
+            models.UniqueConstraint(fields=['event_id', 'type'],
+                name='core_eventstats_event_type'),
+        ]
+
+
+class Event(models.Model):
+    evand_id = models.CharField(max_length=30, unique=True)
+
+    def __str__(self):
+        return self.evand_id
+
+
+class TicketTypeQuerySet(models.QuerySet):
+    def resolve(self, tickets):
+        '''
+        Point ``event`` and ``ticket_type`` of ``tickets`` at the catalog rows
+        of their ``Ticket.catalog`` values, creating the missing ones. Known
+        types come from ``core.catalog.types`` without a query. The title and
+        description of a type follow its latest ticket.
+
+        Runs inside the writing transaction, so rows it creates are only
+        cached once that commits.
+        '''
+        wanted = {}
+        for ticket in tickets:
+            if ticket.catalog is None:
+                continue
+            event_id, type, title, description = ticket.catalog
+            if not event_id:
+                ticket.event = ticket.ticket_type = None
+                continue
+            key = (event_id, type or '')
+            current = wanted.get(key)
+            if current is None or ticket.updated_at >= current[0]:
+                wanted[key] = (ticket.updated_at, title, description)
+
+        entries = {key: catalog.types.get(key) for key in wanted}
+        missing = [key for key, entry in entries.items() if entry is None]
+        learned = self._fetch_or_create(missing, wanted) if missing else {}
+        entries.update(learned)
+        for key, (_, title, description) in wanted.items():
+            event_pk, pk, old_title, old_description = entries[key]
+            if title is None:
+                title = old_title
+            if description is None:
+                description = old_description
+            if (title, description) != (old_title, old_description):
+                # The cached values only tell a change may be due. Compared
+                # again by the UPDATE under the write lock, as another
+                # worker may have stored them already.
+                self.filter(pk=pk).exclude(
+                    title=title, description=description,
+                ).update(title=title, description=description)
+                entries[key] = learned[key] = \
+                    (event_pk, pk, title, description)
+
+        for ticket in tickets:
+            if ticket.catalog is not None and ticket.catalog[0]:
+                event_id, type = ticket.catalog[:2]
+                ticket.event_id, ticket.ticket_type_id = \
+                    entries[(event_id, type or '')][:2]
+        if learned:
+            transaction.on_commit(lambda: catalog.types.update(learned),
+                using=self.db)
+
+    def _fetch_or_create(self, keys, wanted):
+        '''``{(event_id, type): entry}`` of ``keys``, read or inserted.'''
+        events = Event.objects.using(self.db)
+        event_ids = {event_id for event_id, _ in keys}
+        event_pks = dict(events.filter(evand_id__in=event_ids).values_list(
+            'evand_id', 'pk'))
+        if len(event_pks) < len(event_ids):
+            # Concurrent writers may insert the same rows, read them back.
+            events.bulk_create([Event(evand_id=event_id)
+                for event_id in sorted(event_ids - event_pks.keys())],
+                ignore_conflicts=True)
+            event_pks = dict(events.filter(evand_id__in=event_ids)
+                .values_list('evand_id', 'pk'))
+
+        def read():
+            return {
+                (event_id, type): (event_pk, pk, title, description)
+                for event_id, type, event_pk, pk, title, description
+                in self.filter(event__in=event_pks.values()).values_list(
+                    'event__evand_id', 'type', 'event', 'pk', 'title',
+                    'description')
+                if (event_id, type) in wanted
+            }
+
+        found = read()
+        if len(found) < len(keys):
+            self.bulk_create([
+                TicketType(event_id=event_pks[event_id], type=type,
+                    title=wanted[(event_id, type)][1],
+                    description=wanted[(event_id, type)][2])
+                for event_id, type in sorted(keys) if (event_id, type) not in found
+            ], ignore_conflicts=True)
+            found = read()
+        return {key: found[key] for key in keys}
+
+
+class TicketType(models.Model):
+    event = models.ForeignKey(Event, on_delete=models.CASCADE,
+        related_name='ticket_types')
+    type = models.CharField(max_length=20, blank=True, default='')
     title = models.CharField(max_length=50, blank=True, null=True)
-    available_count = models.CharField(max_length=50, blank=True, null=True)
-    price = models.CharField(max_length=20, blank=True, null=True)
     description = models.CharField(max_length=50, blank=True, null=True)
+
+    objects = TicketTypeQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'type'],
+                name='core_tickettype_event_type'),
+        ]
+
+    def __str__(self):
+        return self.title or self.type
+
+
+def is_unique_violation(error):
+    '''Whether an IntegrityError is a duplicate key, not a CHECK or NOT NULL.'''
+    code = getattr(error.__cause__, 'pgcode', None)
+    if code is not None:
+        return code == '23505'
+    return 'UNIQUE constraint failed' in str(error)
+
+
+class TicketQuerySet(models.QuerySet):
+    # Attempts when concurrent deliveries insert the same new ticket.
+    UPSERT_ATTEMPTS = 3
+
+    def upsert(self, tickets):
+        '''
+        Insert or update tickets keyed on ``ticket_id``. The payload with the
+        latest ``updated_at`` wins and older ones are ignored, so redeliveries
+        and out of order updates are idempotent.
+
+        Existing rows are locked before they are compared, so concurrent
+        deliveries for a ticket apply one after the other. When two of them
+        insert the same new ticket the loser retries and finds the row.
+        Updated tickets get the primary key of their row.
+        Returns the number of written rows.
+        '''
+        latest = {}
+        anonymous = []
+        for ticket in tickets:
+            if ticket.ticket_id is None:
+                anonymous.append(ticket)
+                continue
+            current = latest.get(ticket.ticket_id)
+            if current is None or ticket.updated_at >= current.updated_at:
+                latest[ticket.ticket_id] = ticket
+
+        for attempt in range(1, self.UPSERT_ATTEMPTS + 1):
+            try:
+                with metrics.timer('ticket_save'), \
+                        transaction.atomic(using=self.db):
+                    return self._upsert(latest, list(anonymous))
+            except IntegrityError as e:
+                # Other violations, like a negative price, recur on retry.
+                if attempt == self.UPSERT_ATTEMPTS \
+                        or not is_unique_violation(e):
+                    raise
+                metrics.increment('ticket_upsert_conflicts')
+                # In case a cached catalog row was deleted meanwhile.
+                catalog.types.clear()
+
+    def _upsert(self, latest, new):
+        # Locked in ticket_id order so that batches cannot deadlock.
+        existing = {
+            row[0]: row[1:]
+            for row in self.select_for_update(of=('self',)).filter(
+                ticket_id__in=latest).order_by('ticket_id').values_list(
+                'ticket_id', 'pk', 'updated_at', *EventStats.TICKET_FIELDS)
+        }
+        changed = []
+        stats = EventStats.objects.using(self.db)
+        deltas = {}
+        for ticket_id, ticket in latest.items():
+            if ticket_id not in existing:
+                ticket.pk = None
+                new.append(ticket)
+                continue
+            ticket.pk, updated_at, *old = existing[ticket_id]
+            if ticket.updated_at >= updated_at:
+                changed.append(ticket)
+                stats.add_delta(deltas, *old, sign=-1)
+                stats.add_delta(deltas, *stats.ticket_values(ticket))
+        for ticket in new:
+            stats.add_delta(deltas, *stats.ticket_values(ticket))
+        TicketType.objects.using(self.db).resolve(new + changed)
+
+        if len(new) == 1:
+            # Single inserts are the webhook hot path, save() sets the
+            # primary key on every backend.
+            new[0].save(force_insert=True, using=self.db)
+        else:
+            self.bulk_create(new)
+        self.bulk_update(changed, Ticket.UPSERT_FIELDS)
+        stats.apply(deltas)
+        written = new + changed
+        transaction.on_commit(lambda: tickets_changed.send(Ticket,
+            tickets=written), using=self.db)
+        return len(written)
+
+
+class Ticket(models.Model):
+    # Not indexed on their own, the indexes below start with them.
+    event = models.ForeignKey(Event, on_delete=models.PROTECT,
+        related_name='tickets', blank=True, null=True, db_index=False)
+    ticket_type = models.ForeignKey(TicketType, on_delete=models.PROTECT,
+        related_name='tickets', blank=True, null=True, db_index=False)
+    ticket_id = models.CharField(max_length=30, blank=True, null=True,
+        unique=True)
+    available_count = models.IntegerField(blank=True, null=True)
+    # What this ticket was sold for, prices of a type change over time.
+    price = models.PositiveBigIntegerField(blank=True, null=True)
     first_name = models.CharField(max_length=50, blank=True, null=True)
     last_name = models.CharField(max_length=50, blank=True, null=True)
     email = models.CharField(max_length=100, blank=True, null=True)
     mobile = models.CharField(max_length=20, blank=True, null=True)
     discount_id = models.CharField(max_length=30, blank=True, null=True)
-    canceled = models.CharField(max_length=10, blank=True, null=True)
+    canceled = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(default=timezone.now)
+    # Set once at the door, see core.checkin. Not in UPSERT_FIELDS so that
+    # later payloads keep it.
+    checked_in_at = models.DateTimeField(blank=True, null=True)
+    # Door device that scanned the ticket, if it said.
+    checked_in_device = models.CharField(max_length=50, blank=True, null=True)
+
+    # Fields overwritten when a newer payload for the same ticket arrives.
+    UPSERT_FIELDS = [
+        'event', 'ticket_type', 'available_count', 'price', 'first_name',
+        'last_name', 'email', 'mobile', 'discount_id', 'canceled',
+        'updated_at',
+    ]
+    # Values of extract_ticket kept in Event and TicketType, and the lookups
+    # reading them back.
+    CATALOG_FIELDS = ('event_id', 'type', 'title', 'description')
+    CATALOG_LOOKUPS = {
+        'event_id': 'event__evand_id',
+        'type': 'ticket_type__type',
+        'title': 'ticket_type__title',
+        'description': 'ticket_type__description',
+    }
+
+    # (event_id, type, title, description) of a parsed payload, resolved to
+    # event and ticket_type by TicketTypeQuerySet.resolve on upsert.
+    catalog = None
+
+    objects = TicketQuerySet.as_manager()
 
-    def from_evand(self, data: dict):
-        try:
-            self.event_id = data.get('data[ticket][data][event_id]', None)
-            self.ticket_id = data.get('data[ticket_id]', None)
-            self.type = data.get('data[ticket][data][type]', None)
-            self.title = data.get('data[ticket][data][type]', None)
-            self.available_count = data.get('data[ticket][data][available_count]', None)
-            self.price = data.get('data[ticket][data][price]', None)
-            self.description = data.get('data[ticket][data][description]', None)
-            self.first_name = data.get('data[first_name]', None)
-            self.last_name = data.get('data[last_name]', None)
-            self.email = data.get('data[email]', None)
-            self.mobile = data.get('data[mobile]', None)
-            self.discount_id = data.get('data[discount_id]', None)
-            self.canceled = data.get('data[canceled]', None)
-
-            date_format = '%Y-%m-%dT%H:%M:%S%z'
-            date = data.get('data[created_at]', timezone.now().strftime('%Y-%m-%dT%H:%M:%S%z'))
-            self.created_at = datetime.strptime(date, date_format)
-
-            date = data.get('data[updated_at]', timezone.now().strftime('%Y-%m-%dT%H:%M:%S%z'))
-            self.updated_at = datetime.strptime(date, date_format)
-
-            self.save()
-        except Exception as e:
-            print('----------error:')
-            print(str(e))
+    class Meta:
+        # Match the admin ordering and its list_filters, see core.admin.
+        indexes = [
+            models.Index(fields=['updated_at', 'created_at',]),
+            models.Index(fields=['event', 'updated_at', 'created_at',]),
+            models.Index(fields=['ticket_type', 'updated_at', 'created_at',]),
+            models.Index(fields=['canceled', 'updated_at', 'created_at',]),
+            # Check-in lookups, ticket_id has its unique index.
+            models.Index(fields=['mobile',]),
+        ]
+
+    @property
+    def stats_key(self):
+        '''``(event_id, type)`` of the ticket in EventStats.'''
+        if self.catalog is not None:
+            event_id, type = self.catalog[:2]
+            return (event_id or '', type or '') if event_id else ('', '')
+        return (self.event.evand_id if self.event_id else '',
+            self.ticket_type.type if self.ticket_type_id else '')
+
+    def from_evand(self, data: dict, commit=True):
+        with metrics.timer('parse'):
+            values = extract_ticket(data)
+        self.catalog = tuple(values.pop(name) for name in self.CATALOG_FIELDS)
+        for name, value in values.items():
+            setattr(self, name, value)
+
+        if commit:
+            Ticket.objects.upsert([self])
         return self
 
+    @classmethod
+    def upsert_evand(cls, payloads):
+        '''Apply many Evand payloads at once, see ``TicketQuerySet.upsert``.'''
+        return cls.objects.upsert(
+            [cls().from_evand(data, commit=False) for data in payloads])
+
 
 class Attendee(models.Model):
     phone_number = models.IntegerField(
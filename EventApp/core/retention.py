@@ -0,0 +1,65 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core import metrics
+from core.models import WebHookMessage
+
+
+def cutoff(days=None):
+    if days is None:
+        days = settings.WEBHOOK_RETENTION_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def expired_messages(days=None):
+    '''
+    Messages older than the retention window. Pending messages are kept
+    until a worker has had the chance to process them, see
+    ``dead_letter_stale``.
+    '''
+    return WebHookMessage.objects.filter(received_at__lte=cutoff(days)) \
+        .exclude(status=WebHookMessage.Status.PENDING)
+
+
+def dead_letter_stale(days=None, chunk_size=1000):
+    '''
+    Dead-letter pending messages older than the retention window, so that
+    they expire too. Inline mode leaves failed deliveries pending for a
+    retry that only ``process_webhooks`` would make, and deployments that
+    do not run it would keep them forever.
+    Returns the number of dead-lettered messages.
+    '''
+    qs = WebHookMessage.objects.filter(received_at__lte=cutoff(days),
+        status=WebHookMessage.Status.PENDING).order_by('received_at')
+    dead = 0
+    while True:
+        ids = list(qs.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        dead += WebHookMessage.objects.filter(id__in=ids).update(
+            status=WebHookMessage.Status.DEAD, next_attempt_at=None)
+    metrics.increment('webhook_dead', dead)
+    return dead
+
+
+def purge_expired(days=None, chunk_size=1000, time_budget=None):
+    '''
+    Delete expired messages in chunks walking the ``received_at`` index, so
+    that no single statement holds the write lock for long.
+    Stops early once ``time_budget`` seconds have passed.
+    Returns the number of deleted rows.
+    '''
+    deadline = time_budget and time.monotonic() + time_budget
+    dead_letter_stale(days, chunk_size)
+    qs = expired_messages(days).order_by('received_at')
+    deleted = 0
+    while not deadline or time.monotonic() < deadline:
+        ids = list(qs.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        with metrics.timer('retention_purge'):
+            deleted += WebHookMessage.objects.filter(id__in=ids).delete()[0]
+    return deleted
@@ -0,0 +1,122 @@
+'''
+Full-text search over tickets and webhook payloads.
+
+The index is created by migration 0013, with the ticket text redefined by
+0019: an FTS5 table per model kept up to date by triggers on SQLite, and GIN
+expression indexes on Postgres. Terms match as word prefixes, so ``sara``
+finds ``sara@example.com``.
+
+SQLite drops the triggers of a table whenever a migration rebuilds it, so
+they are not created by the migrations but by ``sync_sqlite_index`` after
+every migrate.
+'''
+import re
+
+from django.db import connections, transaction
+from django.db.models.expressions import RawSQL
+
+from core.models import Ticket, WebHookMessage
+
+WORD = re.compile(r'\w+')
+
+TICKET_TEXT = (
+    "coalesce({p}email, '') || ' ' || coalesce({p}mobile, '') || ' ' || "
+    "coalesce({p}ticket_id, '') || ' ' || coalesce({p}first_name, '') || "
+    "' ' || coalesce({p}last_name, '')"
+)
+
+# Indexed text of a row, ``{p}`` is the row prefix in triggers (``new.``).
+SQLITE_TEXT = {
+    Ticket: TICKET_TEXT,
+    WebHookMessage: (
+        "(SELECT group_concat(value, ' ') FROM json_tree({p}payload) "
+        "WHERE type NOT IN ('object', 'array'))"
+    ),
+}
+
+POSTGRES_TEXT = {
+    Ticket: TICKET_TEXT.format(p=''),
+    WebHookMessage: 'payload',
+}
+
+
+def sqlite_triggers(table, text):
+    '''``{name: CREATE statement}`` of the triggers keeping ``{table}_fts``.'''
+    return {
+        f'{table}_fts_insert':
+            f"CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {table}_fts (rowid, body) "
+            f"VALUES (new.id, {text.format(p='new.')}); END",
+        f'{table}_fts_update':
+            f"CREATE TRIGGER {table}_fts_update AFTER UPDATE ON {table} BEGIN "
+            f"DELETE FROM {table}_fts WHERE rowid = old.id; "
+            f"INSERT INTO {table}_fts (rowid, body) "
+            f"VALUES (new.id, {text.format(p='new.')}); END",
+        f'{table}_fts_delete':
+            f"CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM {table}_fts WHERE rowid = old.id; END",
+    }
+
+
+def sync_sqlite_index(sender, using, **kwargs):
+    '''
+    ``post_migrate`` receiver re-creating missing or outdated triggers, and
+    then reindexing the table, as rows may have changed without them.
+    Does nothing when the triggers are current.
+    '''
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    tables = connection.introspection.table_names()
+    with transaction.atomic(using), connection.cursor() as cursor:
+        for model, text in SQLITE_TEXT.items():
+            table = model._meta.db_table
+            if f'{table}_fts' not in tables:
+                # Migrated back before 0013.
+                continue
+            triggers = sqlite_triggers(table, text)
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+                "AND name IN (%s, %s, %s)", list(triggers))
+            if dict(cursor.fetchall()) == triggers:
+                continue
+            for name, sql in triggers.items():
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+                cursor.execute(sql)
+            cursor.execute(f'DELETE FROM {table}_fts')
+            cursor.execute(
+                f'INSERT INTO {table}_fts (rowid, body) '
+                f"SELECT id, {text.format(p='')} FROM {table}")
+
+
+def sqlite_query(term):
+    return ' '.join(f'"{word}"*' for word in WORD.findall(term))
+
+
+def postgres_query(term):
+    # Whole words, so that the parser still sees e-mails as one token.
+    return ' & '.join(
+        "'" + word.replace('\\', '\\\\').replace("'", "''") + "':*"
+        for word in term.split())
+
+
+def search(queryset, term):
+    '''
+    Filter ``queryset`` to rows matching every word of ``term``. Returns
+    None when the database has no full-text index for the model.
+    '''
+    model = queryset.model
+    vendor = connections[queryset.db].vendor
+    table = model._meta.db_table
+    if not WORD.search(term):
+        return queryset
+    if vendor == 'sqlite' and model in POSTGRES_TEXT:
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s',
+            [sqlite_query(term)]))
+    if vendor == 'postgresql' and model in POSTGRES_TEXT:
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT id FROM {table} WHERE to_tsvector('simple', "
+            f"{POSTGRES_TEXT[model]}) @@ to_tsquery('simple', %s)",
+            [postgres_query(term)]))
+    return None
@@ -1,5 +1,1219 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from urllib.parse import urlencode
+from unittest import addModuleCleanup, mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, close_old_connections, connection
+from django.http import QueryDict
+from asgiref.sync import async_to_sync
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, \
+    TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
 
-# TODO: Write Tests
+from core import backpressure, catalog, checkin, dedup, metrics
+from core.backpressure import InFlightLimiter, SlotLimiter
+from core.archive import archive_expired, archive_files
+from core.evand import evaluate_evand_fucking_data, extract_ticket, \
+    flatten_evand_data, parse_datetime
+from core.ingest import claim_batch, drain, process_webhook_payload
+from core.lru import LRU
+from core.models import Event, EventStats, TicketType, WebHookMessage, \
+    Ticket
+from core.pagination import FastPaginator
+from core.retention import purge_expired
+from core.search import search
+from core.hook import async_webhook
+from EventApp.settings import BASE_DIR, database_from_url
+
+
+def evand_payload(ticket_id='1001', **extra):
+    payload = {
+        'data[ticket_id]': ticket_id,
+        'data[ticket][data][event_id]': '42',
+        'data[ticket][data][type]': 'normal',
+        'data[ticket][data][title]': 'Normal',
+        'data[ticket][data][available_count]': '10',
+        'data[ticket][data][price]': '150000',
+        'data[ticket][data][description]': 'General admission',
+        'data[first_name]': 'Sara',
+        'data[last_name]': 'Ahmadi',
+        'data[email]': 'sara@example.com',
+        'data[mobile]': '09120000000',
+        'data[discount_id]': '',
+        'data[canceled]': 'false',
+        'data[created_at]': '2022-05-11T20:00:00+04:30',
+        'data[updated_at]': '2022-05-11T20:00:00+04:30',
+    }
+    payload.update(extra)
+    return payload
+
+
+def setUpModule():
+    # The metrics files and webhook slots of the tests go to a directory of
+    # their own rather than the deployment's.
+    directory = tempfile.mkdtemp()
+    addModuleCleanup(shutil.rmtree, directory)
+    override = override_settings(METRICS_DIR=str(Path(directory, 'metrics')),
+        WEBHOOK_LIMITER_DIR=str(Path(directory, 'slots')))
+    override.enable()
+    addModuleCleanup(override.disable)
+    patcher = mock.patch.object(backpressure, 'limiter',
+        backpressure.make_limiter())
+    patcher.start()
+    addModuleCleanup(patcher.stop)
+    # Nothing left for the flush at exit.
+    addModuleCleanup(metrics.reset)
+
+
+class WebhookQueueTests(TestCase):
+
+    def setUp(self):
+        dedup.recent.clear()
+
+    def post(self, payload):
+        return self.client.post(reverse('webhook'), payload)
+
+    @override_settings(WEBHOOK_INGEST_MODE='inline')
+    def test_inline_mode_processes_ticket(self):
+        self.post(evand_payload())
+        message = WebHookMessage.objects.get()
+        self.assertEqual(message.status, WebHookMessage.Status.PROCESSED)
+        self.assertEqual(message.payload['data']['ticket']['data']['price'],
+            '150000')
+        self.assertEqual(Ticket.objects.get().ticket_id, '1001')
+
+    @override_settings(WEBHOOK_INGEST_MODE='queue')
+    def test_queue_mode_defers_processing(self):
+        response = self.post(evand_payload())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(WebHookMessage.objects.get().status,
+            WebHookMessage.Status.PENDING)
+        self.assertFalse(Ticket.objects.exists())
+
+        self.assertEqual(drain(), (1, 0))
+        self.assertEqual(WebHookMessage.objects.get().status,
+            WebHookMessage.Status.PROCESSED)
+        self.assertEqual(Ticket.objects.get().ticket_id, '1001')
+
+    @override_settings(WEBHOOK_INGEST_MODE='queue', WEBHOOK_RETRY_DELAY=0)
+    def test_failing_message_is_dead_lettered(self):
+        self.post(evand_payload(**{'data[created_at]': 'not a date'}))
+        with self.assertLogs('core.ingest', 'WARNING'):
+            self.assertEqual(drain(max_attempts=2), (0, 1))
+        with self.assertLogs('core.ingest', 'ERROR') as logs:
+            self.assertEqual(drain(max_attempts=2), (0, 1))
+        self.assertIn('ValueError', logs.output[0])
+        message = WebHookMessage.objects.get()
+        self.assertEqual(message.status, WebHookMessage.Status.DEAD)
+        self.assertEqual(message.attempts, 2)
+        self.assertIn('ValueError', message.last_error)
+        self.assertEqual(drain(max_attempts=2), (0, 0))
+
+    @override_settings(WEBHOOK_INGEST_MODE='queue')
+    def test_claimed_messages_are_leased(self):
+        self.post(evand_payload('1'))
+        self.post(evand_payload('2'))
+        with self.assertNumQueries(4):
+            # In a transaction of its own: the claim and the lease.
+            claimed = claim_batch(1)
+        self.assertEqual(len(claimed), 1)
+        leased = WebHookMessage.objects.get(id=claimed[0].id)
+        self.assertGreater(leased.next_attempt_at, timezone.now())
+        # Only the other message is due, and a lapsed lease again.
+        self.assertEqual([m.id for m in claim_batch(2)],
+            [m.id for m in WebHookMessage.objects.exclude(id=leased.id)])
+        WebHookMessage.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(drain(), (2, 0))
+
+
+class RetentionTests(TestCase):
+
+    def test_purge_expired_in_chunks(self):
+        old = timezone.now() - timedelta(days=20)
+        WebHookMessage.objects.bulk_create([
+            WebHookMessage(received_at=old,
+                status=WebHookMessage.Status.PROCESSED)
+            for _ in range(5)
+        ] + [
+            WebHookMessage(received_at=old),
+            WebHookMessage(status=WebHookMessage.Status.PROCESSED),
+        ])
+        WebHookMessage.objects.create(
+            received_at=timezone.now() - timedelta(days=1))
+        # The pending message past the window is dead-lettered, then purged.
+        self.assertEqual(purge_expired(days=15, chunk_size=2), 6)
+        # The recent ones are kept, pending or not.
+        self.assertEqual(WebHookMessage.objects.count(), 2)
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_archive_and_replay(self):
+        old = datetime(2022, 5, 11, 12, tzinfo=dt_timezone.utc)
+        for i, ticket_id in enumerate(('1', '2', '3')):
+            WebHookMessage.objects.create(
+                received_at=old + timedelta(days=i // 2),
+                payload=evaluate_evand_fucking_data(evand_payload(ticket_id)),
+                status=WebHookMessage.Status.PROCESSED)
+        WebHookMessage.objects.create(received_at=old)
+
+        self.assertEqual(archive_expired(self.directory, days=15,
+            chunk_size=2), 4)
+        # The stale pending message is archived as dead.
+        self.assertFalse(WebHookMessage.objects.exists())
+        with gzip.open(self.directory / '2022' / '05' /
+                '2022-05-11.jsonl.gz') as f:
+            self.assertEqual(sorted(json.loads(line)['status'] for line in f),
+                ['dead', 'processed', 'processed'])
+        self.assertEqual(
+            [path.name for path in archive_files([self.directory])],
+            ['2022-05-11.jsonl.gz', '2022-05-12.jsonl.gz'])
+
+        call_command('replay_webhooks', workers=0, stdout=StringIO(),
+            archive=[str(self.directory)], since='2022-05-12T00:00')
+        self.assertEqual(Ticket.objects.get().ticket_id, '3')
+
+
+class TicketUpsertTests(TestCase):
+
+    def test_redelivery_updates_single_row(self):
+        Ticket().from_evand(evand_payload())
+        Ticket().from_evand(evand_payload(**{
+            'data[canceled]': 'true',
+            'data[updated_at]': '2022-05-12T10:00:00+04:30',
+        }))
+        ticket = Ticket.objects.get()
+        self.assertIs(ticket.canceled, True)
+
+    def test_older_update_is_ignored(self):
+        Ticket.upsert_evand([
+            evand_payload(**{
+                'data[canceled]': 'true',
+                'data[updated_at]': '2022-05-12T10:00:00+04:30',
+            }),
+            evand_payload('1002'),
+        ])
+        Ticket.upsert_evand([evand_payload()])
+        self.assertEqual(Ticket.objects.count(), 2)
+        self.assertIs(Ticket.objects.get(ticket_id='1001').canceled, True)
+
+    def test_check_violation_is_not_retried(self):
+        before = metrics.counters().get('ticket_upsert_conflicts', 0)
+        with self.assertRaises(IntegrityError):
+            Ticket.upsert_evand([evand_payload(**{
+                'data[ticket][data][price]': '-1'})])
+        self.assertEqual(metrics.counters().get('ticket_upsert_conflicts', 0),
+            before)
+
+    def test_typed_fields_migration_nulls_bad_numbers(self):
+        to_int = import_module('core.migrations.0015_typed_ticket_fields') \
+            .to_int
+        self.assertEqual(to_int(' 150,000.00 ', 0, 2 ** 63 - 1), 150000)
+        for value in ('nan', 'inf', '-Infinity', '-5', '1e30', 'abc', ''):
+            self.assertIsNone(to_int(value, 0, 2 ** 63 - 1), value)
+
+
+class CatalogTests(TestCase):
+
+    def setUp(self):
+        catalog.types.clear()
+        # Rows cached by committing tests are gone after the rollback.
+        self.addCleanup(catalog.types.clear)
+
+    def test_tickets_reference_event_and_type(self):
+        Ticket.upsert_evand([
+            evand_payload('1'),
+            evand_payload('2'),
+            evand_payload('3', **{'data[ticket][data][type]': 'vip',
+                'data[ticket][data][title]': 'VIP seats'}),
+        ])
+        self.assertEqual(Event.objects.get().evand_id, '42')
+        self.assertEqual(sorted(TicketType.objects.values_list(
+            'type', 'description')),
+            [('normal', 'General admission'), ('vip', 'General admission')])
+        ticket = Ticket.objects.select_related('event', 'ticket_type').get(
+            ticket_id='3')
+        self.assertEqual(ticket.event.evand_id, '42')
+        self.assertEqual(ticket.ticket_type.title, 'VIP seats')
+
+    def test_known_types_cost_no_queries(self):
+        Ticket().from_evand(evand_payload('1'))
+        # Not cached before the transaction commits.
+        self.assertIsNone(catalog.types.get(('42', 'normal')))
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket().from_evand(evand_payload('2'))
+        with CaptureQueriesContext(connection) as queries:
+            Ticket().from_evand(evand_payload('3'))
+        self.assertEqual([q['sql'] for q in queries if any(
+            table in q['sql'].split(' WHERE ')[0]
+            for table in ('FROM "core_event"', 'FROM "core_tickettype"',
+                'INTO "core_event"', 'INTO "core_tickettype"',
+                'UPDATE "core_tickettype"'))], [])
+        self.assertEqual(Ticket.objects.filter(
+            ticket_type__type='normal').count(), 3)
+
+    def test_description_follows_latest_ticket(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket().from_evand(evand_payload('1'))
+        Ticket().from_evand(evand_payload('2', **{
+            'data[ticket][data][description]': 'Early bird',
+            'data[updated_at]': '2022-05-12T20:00:00+04:30',
+        }))
+        self.assertEqual(TicketType.objects.get().description, 'Early bird')
+
+    def test_stale_cache_does_not_rewrite_type(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket().from_evand(evand_payload('1'))
+        # Another worker stored the new description, this one cached the old.
+        TicketType.objects.update(description='Early bird')
+        written = []
+
+        def rowcount(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if sql.startswith('UPDATE "core_tickettype"'):
+                written.append(context['cursor'].rowcount)
+            return result
+
+        with self.captureOnCommitCallbacks(execute=True), \
+                connection.execute_wrapper(rowcount):
+            Ticket().from_evand(evand_payload('2', **{
+                'data[ticket][data][description]': 'Early bird',
+            }))
+        self.assertEqual(written, [0])
+        self.assertEqual(catalog.types.get(('42', 'normal'))[3], 'Early bird')
+
+
+class ReplayTests(TestCase):
+
+    def test_replay_rebuilds_tickets(self):
+        for ticket_id in ('1', '2', '1'):
+            WebHookMessage.objects.create(
+                payload={k: [v] for k, v in evand_payload(ticket_id).items()})
+        bad = WebHookMessage.objects.create(
+            payload={'data[created_at]': ['bad']})
+
+        out, err = StringIO(), StringIO()
+        call_command('replay_webhooks', workers=0, chunk_size=2, stdout=out,
+            stderr=err)
+        self.assertEqual(
+            sorted(Ticket.objects.values_list('ticket_id', flat=True)),
+            ['1', '2'])
+        self.assertIn('4/4 messages', out.getvalue())
+        self.assertIn('1 failed', out.getvalue())
+        self.assertIn(f'Message {bad.pk} not replayed: ValueError',
+            err.getvalue())
+
+    def test_since_date_or_naive_datetime(self):
+        for day, ticket_id in ((11, '1'), (12, '2')):
+            WebHookMessage.objects.create(
+                received_at=datetime(2022, 5, day, tzinfo=dt_timezone.utc),
+                payload={k: [v] for k, v in evand_payload(ticket_id).items()})
+        for since in ('2022-05-12', '2022-05-12T00:00'):
+            Ticket.objects.all().delete()
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', RuntimeWarning)
+                call_command('replay_webhooks', workers=0, since=since,
+                    stdout=StringIO())
+            self.assertEqual(
+                list(Ticket.objects.values_list('ticket_id', flat=True)),
+                ['2'], since)
+        with self.assertRaisesMessage(CommandError, 'Invalid date'):
+            call_command('replay_webhooks', workers=0, since='2022-13-01')
+
+
+class ImportTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def import_file(self, name, content, **options):
+        path = self.directory / name
+        if name.endswith('.gz'):
+            with gzip.open(path, 'wt') as f:
+                f.write(content)
+        else:
+            path.write_text(content)
+        out, self.err = StringIO(), StringIO()
+        call_command('import_evand', str(path), workers=0, chunk_size=2,
+            stdout=out, stderr=self.err, **options)
+        return out.getvalue()
+
+    def test_csv(self):
+        out = self.import_file('export.csv',
+            'ticket_id,ticket.data.event_id,data[ticket][data][price],'
+            'first_name,created_at\n'
+            '1,42,"150,000",Sara,2022-05-11T20:00:00+04:30\n'
+            '2,42,250000,Ali,2022-05-11T21:00:00+04:30\n'
+            '3,42,250000,Reza,not a date\n')
+        self.assertIn('Imported 2 tickets from 3 rows', out)
+        self.assertIn('1 failed', out)
+        self.assertIn('Row 3 not imported: ValueError', self.err.getvalue())
+        self.assertEqual(Ticket.objects.get(ticket_id='1').price, 150000)
+        self.assertEqual(EventStats.objects.get().revenue, 400000)
+
+    def test_json_and_jsonl(self):
+        attendee = {'ticket_id': '1', 'ticket': {'data': {'event_id': '42'}}}
+        self.import_file('export.json', json.dumps([
+            attendee,
+            {'data': {**attendee, 'ticket_id': '2'}},
+            evand_payload('3'),
+        ]))
+        self.import_file('export.jsonl.gz', '\n'.join(
+            json.dumps(evand_payload(ticket_id)) for ticket_id in '345'))
+        self.assertEqual(
+            sorted(Ticket.objects.values_list('ticket_id', flat=True)),
+            ['1', '2', '3', '4', '5'])
+
+
+class EvandParserTests(SimpleTestCase):
+
+    def test_nested_keys(self):
+        self.assertEqual(evaluate_evand_fucking_data({
+            'event': 'attendee.created',
+            'data[ticket_id]': '1',
+            'data[ticket][data][price]': '10',
+            'data[ticket][data][type]': 'vip',
+        }), {
+            'event': 'attendee.created',
+            'data': {
+                'ticket_id': '1',
+                'ticket': {'data': {'price': '10', 'type': 'vip'}},
+            },
+        })
+
+    def test_querydict_multi_values(self):
+        data = QueryDict('data[tags][]=a&data[tags][]=b&data[email]=x&data[email]=y')
+        self.assertEqual(evaluate_evand_fucking_data(data), {
+            'data': {'tags': ['a', 'b'], 'email': 'y'},
+        })
+
+    def test_children_win_in_any_order(self):
+        items = [('data[ticket]', 'x'), ('data[ticket][data][type]', 'vip')]
+        for order in (items, items[::-1]):
+            self.assertEqual(evaluate_evand_fucking_data(dict(order)),
+                {'data': {'ticket': {'data': {'type': 'vip'}}}}, order)
+
+    def test_stored_payload_lists(self):
+        self.assertEqual(
+            evaluate_evand_fucking_data({'data[mobile]': ['0912']}),
+            {'data': {'mobile': '0912'}})
+
+
+class TicketMappingTests(SimpleTestCase):
+
+    def test_flat_stored_and_nested_payloads_agree(self):
+        payload = evand_payload()
+        stored = {key: [value] for key, value in payload.items()}
+        expected = extract_ticket(payload)
+        self.assertEqual(extract_ticket(stored), expected)
+        self.assertEqual(
+            extract_ticket(evaluate_evand_fucking_data(payload)), expected)
+        self.assertEqual(expected['ticket_id'], '1001')
+        self.assertEqual((expected['type'], expected['title']),
+            ('normal', 'Normal'))
+        self.assertEqual(expected['created_at'].utcoffset(),
+            timedelta(hours=4, minutes=30))
+
+    def test_coercion(self):
+        values = extract_ticket(evand_payload(**{
+            'data[ticket][data][price]': '150,000.00',
+            'data[ticket][data][available_count]': '',
+            'data[canceled]': 'true',
+        }))
+        self.assertEqual(values['price'], 150000)
+        self.assertIsNone(values['available_count'])
+        self.assertIs(values['canceled'], True)
+        self.assertIs(extract_ticket({})['canceled'], False)
+        with self.assertRaises(ValueError):
+            extract_ticket(evand_payload(**{'data[ticket][data][price]': 'x'}))
+
+    def test_missing_dates_default_to_now(self):
+        before = timezone.now()
+        values = extract_ticket({'data[ticket_id]': '1'})
+        self.assertGreaterEqual(values['updated_at'], before)
+        self.assertIsNone(values['email'])
+
+    def test_parse_datetime(self):
+        self.assertEqual(parse_datetime('2022-05-11T15:30:00Z'),
+            parse_datetime('2022-05-11T20:00:00+04:30'))
+        self.assertEqual(parse_datetime('2022-05-11T15:30:00').utcoffset(),
+            timedelta(0))
+
+    def test_parse_datetime_fallback(self):
+        # fromisoformat before Python 3.11 rejects these, and every version
+        # the surrounding blanks.
+        expected = parse_datetime('2022-05-11T20:00:00.500000+04:30')
+        for value in ('2022-05-11T20:00:00.5+0430',
+                ' 2022-05-11T20:00:00.5+0430 '):
+            self.assertEqual(parse_datetime(value), expected)
+        self.assertEqual(parse_datetime('2022-05-11T20:00:00+0430'),
+            parse_datetime('2022-05-11T15:30:00Z'))
+        with self.assertRaises(ValueError):
+            parse_datetime('yesterday')
+
+
+class AsyncWebhookTests(TransactionTestCase):
+
+    def setUp(self):
+        dedup.recent.clear()
+        # Rows cached by an earlier test are flushed with the database.
+        catalog.types.clear()
+
+    @override_settings(WEBHOOK_INGEST_MODE='inline')
+    def test_async_view_stores_and_processes(self):
+        request = RequestFactory().post('/hook', evand_payload())
+        response = async_to_sync(async_webhook)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(WebHookMessage.objects.get().status,
+            WebHookMessage.Status.PROCESSED)
+        self.assertEqual(Ticket.objects.get().ticket_id, '1001')
+
+    def test_async_view_rejects_get(self):
+        request = RequestFactory().get('/hook')
+        response = async_to_sync(async_webhook)(request)
+        self.assertEqual(response.status_code, 405)
+
+
+class ConcurrentIngestTests(TransactionTestCase):
+
+    def setUp(self):
+        catalog.types.clear()
+
+    def test_parallel_deliveries(self):
+        '''
+        Every version of a set of tickets delivered at once from several
+        threads, in random order: each ticket ends at its latest version and
+        the stats match a rebuild.
+        '''
+        versions = [
+            evand_payload(str(ticket_id), **{
+                'data[canceled]': 'true' if version % 2 else 'false',
+                'data[ticket][data][type]': ('normal', 'vip')[version % 2],
+                'data[updated_at]':
+                    f'2022-05-{10 + version:02d}T20:00:00+04:30',
+            })
+            for ticket_id in range(10)
+            for version in range(6)
+        ]
+        random.Random(0).shuffle(versions)
+
+        def deliver(payload):
+            try:
+                process_webhook_payload(payload)
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(deliver, versions))
+
+        for ticket in Ticket.objects.all():
+            self.assertEqual(ticket.updated_at.day, 15)
+            self.assertIs(ticket.canceled, True)
+            self.assertEqual(ticket.ticket_type.type, 'vip')
+        def stats():
+            # Incremental updates leave emptied rows behind, rebuilds do not.
+            return list(EventStats.objects.exclude(sold=0, canceled=0).order_by(
+                'type').values_list('type', 'sold', 'canceled', 'revenue'))
+
+        self.assertEqual(stats(), [('vip', 0, 10, 0)])
+        EventStats.objects.rebuild()
+        self.assertEqual(stats(), [('vip', 0, 10, 0)])
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        dedup.recent.clear()
+
+    def test_ticket_search_tracks_updates(self):
+        Ticket().from_evand(evand_payload())
+        Ticket().from_evand(evand_payload('1002', **{
+            'data[email]': 'reza@example.com'}))
+        self.assertEqual(
+            list(search(Ticket.objects.all(), 'rez').values_list(
+                'ticket_id', flat=True)), ['1002'])
+        self.assertEqual(search(Ticket.objects.all(), 'example').count(), 2)
+
+        Ticket.objects.filter(ticket_id='1002').update(email='ali@example.com')
+        self.assertFalse(search(Ticket.objects.all(), 'reza').exists())
+
+    def test_payload_search(self):
+        self.client.post(reverse('webhook'), evand_payload())
+        WebHookMessage.objects.create(payload={'data[email]': ['x@y.z']})
+        self.assertEqual(search(WebHookMessage.objects.all(), 'ahmadi').count(), 1)
+        WebHookMessage.objects.all().delete()
+        self.assertFalse(search(WebHookMessage.objects.all(), 'ahmadi').exists())
+
+    def test_migrate_restores_triggers(self):
+        Ticket().from_evand(evand_payload())
+        # As when a migration rebuilds the table.
+        with connection.cursor() as cursor:
+            for action in ('insert', 'update', 'delete'):
+                cursor.execute(f'DROP TRIGGER core_ticket_fts_{action}')
+        Ticket.objects.update(email='reza@example.com')
+
+        call_command('migrate', verbosity=0)
+        self.assertEqual(search(Ticket.objects.all(), 'reza').count(), 1)
+        Ticket().from_evand(evand_payload('1002', **{
+            'data[email]': 'ali@example.com'}))
+        self.assertEqual(search(Ticket.objects.all(), 'ali').count(), 1)
+        # Current triggers are left alone.
+        with CaptureQueriesContext(connection) as queries:
+            call_command('migrate', verbosity=0)
+        self.assertFalse([q['sql'] for q in queries if q['sql'].startswith(
+            ('CREATE TRIGGER', 'DROP TRIGGER', 'DELETE', 'INSERT'))])
+
+
+class PaginatorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ticket.upsert_evand([
+            evand_payload(str(i), **{
+                'data[updated_at]': f'2022-05-{10 + i % 3}T20:00:00+04:30'})
+            for i in range(25)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_keyset_pages_match_offset_pages(self):
+        queryset = Ticket.objects.order_by('-updated_at', 'created_at', 'id')
+        expected = list(queryset.values_list('id', flat=True))
+        paginator = FastPaginator(queryset, 10)
+        pages = []
+        with CaptureQueriesContext(connection) as queries:
+            for number in paginator.page_range:
+                pages += [t.id for t in paginator.page(number)]
+        self.assertEqual(pages, expected)
+        self.assertNotIn('OFFSET', queries[-1]['sql'])
+
+    def test_null_sort_keys(self):
+        for ticket in Ticket.objects.all():
+            i = int(ticket.ticket_id)
+            ticket.email = None if i % 3 == 0 else f'{i % 4}@example.com'
+            ticket.save(update_fields=['email'])
+        for ordering in (('-email', 'id'), ('email', '-id')):
+            cache.clear()
+            queryset = Ticket.objects.order_by(*ordering)
+            expected = list(queryset.values_list('id', flat=True))
+            # Pages of 4 end on NULL and non-NULL emails alike.
+            paginator = FastPaginator(queryset, 4)
+            pages = []
+            with CaptureQueriesContext(connection) as queries:
+                for number in paginator.page_range:
+                    pages += [t.id for t in paginator.page(number)]
+            self.assertEqual(pages, expected, ordering)
+            self.assertNotIn('OFFSET', queries[-1]['sql'])
+
+    def test_count_is_cached(self):
+        queryset = Ticket.objects.order_by('id')
+        self.assertEqual(FastPaginator(queryset, 10).count, 25)
+        Ticket.objects.filter(ticket_id='0').delete()
+        self.assertEqual(FastPaginator(queryset, 10).count, 25)
+
+    def test_admin_changelist(self):
+        user = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        response = self.client.get(reverse('admin:core_ticket_changelist'),
+            {'event__id__exact': Event.objects.get(evand_id='42').pk,
+                'q': 'sara'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 25)
+
+
+class EventStatsTests(TestCase):
+
+    def stats(self):
+        return {
+            (s.event_id, s.type): (s.sold, s.canceled, s.revenue)
+            for s in EventStats.objects.all()
+        }
+
+    def test_incremental_stats_follow_updates(self):
+        Ticket().from_evand(evand_payload('1'))
+        Ticket().from_evand(evand_payload('2', **{
+            'data[ticket][data][type]': 'vip',
+            'data[ticket][data][price]': '300000'}))
+        Ticket().from_evand(evand_payload('3'))
+        self.assertEqual(self.stats(), {
+            ('42', 'normal'): (2, 0, 300000),
+            ('42', 'vip'): (1, 0, 300000),
+        })
+
+        # Cancellation, then a stale redelivery of the purchase.
+        Ticket().from_evand(evand_payload('1', **{
+            'data[canceled]': 'true',
+            'data[updated_at]': '2022-05-12T10:00:00+04:30'}))
+        Ticket().from_evand(evand_payload('1'))
+        self.assertEqual(self.stats()[('42', 'normal')], (1, 1, 150000))
+
+        expected = self.stats()
+        EventStats.objects.all().delete()
+        call_command('rebuild_event_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), expected)
+
+    def test_endpoint(self):
+        Ticket.upsert_evand([evand_payload('1'), evand_payload('2')])
+        url = reverse('event-stats', args=['42'])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+        with self.assertNumQueries(3):
+            # Session, user and the stats row.
+            response = self.client.get(url)
+        self.assertEqual(response.json()['sold'], 2)
+        self.assertEqual(response.json()['revenue'], 300000)
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ticket.upsert_evand([
+            evand_payload('1', **{'data[first_name]': 'سارا'}),
+            evand_payload('2'),
+            evand_payload('3', **{'data[ticket][data][event_id]': '43'}),
+            evand_payload('4', **{'data[ticket][data][event_id]': '44'}),
+        ])
+        cls.user = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        url = reverse('export-tickets', args=['csv'])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+        response = self.client.get(url, {'event_id': '42,43', 'jalali': '1'})
+        rows = list(csv.DictReader(StringIO(self.content(response).lstrip(
+            '\ufeff'))))
+        self.assertEqual([row['ticket_id'] for row in rows], ['1', '2', '3'])
+        self.assertEqual(rows[0]['first_name'], 'سارا')
+        self.assertEqual(rows[0]['created_at'], '2022-05-11T15:30:00+00:00')
+        self.assertEqual(rows[0]['created_at_jalali'], '1401-02-21 15:30:00')
+
+    def test_jsonl(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export-tickets', args=['jsonl']),
+            {'event_id': ['42', '44']})
+        rows = [json.loads(line)
+            for line in self.content(response).splitlines()]
+        self.assertEqual([row['ticket_id'] for row in rows], ['1', '2', '4'])
+        self.assertEqual(rows[0]['price'], 150000)
+        self.assertNotIn('created_at_jalali', rows[0])
+        self.assertEqual(response['Content-Disposition'],
+            'attachment; filename="tickets-42-44.jsonl"')
+
+    def test_filename_is_sanitized(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export-tickets', args=['csv']),
+            {'event_id': '42";x=.exe'})
+        self.assertEqual(response['Content-Disposition'],
+            'attachment; filename="tickets-42xexe.csv"')
+
+    def test_admin_action(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('admin:core_ticket_changelist'), {
+            'action': 'export_jsonl',
+            '_selected_action': Ticket.objects.filter(
+                ticket_id='3').values_list('pk', flat=True),
+        })
+        self.assertEqual(response['Content-Disposition'],
+            'attachment; filename="tickets.jsonl"')
+        self.assertEqual(json.loads(self.content(response))['ticket_id'], '3')
+
+
+@override_settings(WEBHOOK_INGEST_MODE='inline', METRICS_TOKEN='secret')
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        dedup.recent.clear()
+        metrics.reset()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(METRICS_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_endpoint(self):
+        for _ in range(2):
+            self.client.post(reverse('webhook'), evand_payload())
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        text = response.content.decode()
+        self.assertIn('eventapp_webhook_received_total 2\n', text)
+        self.assertIn('eventapp_webhook_duplicates_total 1\n', text)
+        self.assertIn('eventapp_webhook_processed_total 1\n', text)
+        for stage in ('request', 'raw_write', 'parse', 'ticket_save'):
+            self.assertIn(
+                f'eventapp_stage_duration_seconds_count{{stage="{stage}"}}',
+                text)
+
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_processes_are_summed(self):
+        metrics.increment('webhook_received', 2)
+        # Another worker, and a management command that has exited.
+        worker = subprocess.Popen([sys.executable, '-c',
+            'import time; time.sleep(60)'])
+        self.addCleanup(worker.kill)
+        (self.directory / f'{worker.pid}-a.json').write_text(json.dumps({
+            'counters': {'webhook_received': 3}, 'timers': {}}))
+        command = subprocess.run([sys.executable, '-c', 'import os; '
+            'print(os.getpid())'], capture_output=True, text=True)
+        (self.directory / f'{command.stdout.strip()}-b.json').write_text(
+            json.dumps({'counters': {}, 'timers': {'retention_purge': [
+                [0] * (len(metrics.BUCKETS) + 1), 1, 0.5]}}))
+
+        for _ in range(2):
+            text = metrics.render()
+            self.assertIn('eventapp_webhook_received_total 5\n', text)
+            self.assertIn('eventapp_stage_duration_seconds_count'
+                '{stage="retention_purge"} 1\n', text)
+        self.assertEqual(sorted(path.name
+            for path in self.directory.glob('*.json')),
+            sorted(['exited.json', f'{worker.pid}-a.json', metrics._file]))
+
+    def test_histogram(self):
+        metrics.observe('parse', 0.003)
+        metrics.observe('parse', 20)
+        text = metrics.render()
+        prefix = 'eventapp_stage_duration_seconds'
+        self.assertIn(f'{prefix}_bucket{{stage="parse",le="0.0025"}} 0\n', text)
+        self.assertIn(f'{prefix}_bucket{{stage="parse",le="0.005"}} 1\n', text)
+        self.assertIn(f'{prefix}_bucket{{stage="parse",le="+Inf"}} 2\n', text)
+        self.assertIn(f'{prefix}_sum{{stage="parse"}} 20.003000\n', text)
+
+
+class DuplicateDeliveryTests(TestCase):
+
+    def setUp(self):
+        dedup.recent.clear()
+
+    def post(self, payload):
+        return self.client.post(reverse('webhook'), payload)
+
+    def test_redelivery_is_acked_from_memory(self):
+        before = metrics.counters().get('webhook_duplicates', 0)
+        self.post(evand_payload())
+        with self.assertNumQueries(0):
+            response = self.post(evand_payload())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(WebHookMessage.objects.count(), 1)
+        self.assertEqual(metrics.counters()['webhook_duplicates'], before + 1)
+
+    def test_redelivery_to_another_process_hits_unique_index(self):
+        self.post(evand_payload())
+        dedup.recent.clear()
+        self.post(evand_payload())
+        self.assertEqual(WebHookMessage.objects.count(), 1)
+        self.assertEqual(Ticket.objects.count(), 1)
+
+    def test_hash_ignores_key_order_and_entry_point(self):
+        payload = evand_payload()
+        reordered = dict(reversed(list(payload.items())))
+        nested = evaluate_evand_fucking_data(payload)
+        nested['data'] = dict(reversed(list(nested['data'].items())))
+        digest = dedup.payload_hash(QueryDict(urlencode(payload)))
+        self.assertEqual(dedup.payload_hash(reordered), digest)
+        self.assertEqual(
+            dedup.payload_hash(flatten_evand_data(nested)), digest)
+
+    def test_batch_redelivery_of_a_webhook_delivery(self):
+        self.post(evand_payload())
+        dedup.recent.clear()
+        nested = evaluate_evand_fucking_data(evand_payload())
+        response = self.client.post(reverse('webhook-batch'), [nested],
+            content_type='application/json')
+        self.assertEqual(response.json()['results'], [{'status': 'duplicate'}])
+        self.assertEqual(WebHookMessage.objects.count(), 1)
+
+    def test_lru_is_bounded(self):
+        recent = LRU(2)
+        recent.add('a')
+        recent.add('b')
+        self.assertIn('a', recent)
+        recent.add('c')
+        self.assertNotIn('b', recent)
+        self.assertIn('a', recent)
+        self.assertIn('c', recent)
+
+
+class BackpressureTests(TestCase):
+
+    def setUp(self):
+        dedup.recent.clear()
+        self.limiter = InFlightLimiter(1)
+        patcher = mock.patch.object(backpressure, 'limiter', self.limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sheds_past_the_ceiling(self):
+        before = metrics.counters().get('webhook_shed', 0)
+        self.assertTrue(self.limiter.acquire())
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('webhook'), evand_payload())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(metrics.counters()['webhook_shed'], before + 1)
+
+        self.limiter.release()
+        response = self.client.post(reverse('webhook'), evand_payload())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(WebHookMessage.objects.count(), 1)
+        self.assertEqual(self.limiter.active, 0)
+
+    def test_queued_request_gets_a_freed_slot(self):
+        limiter = InFlightLimiter(1, queue=1, timeout=5)
+        limiter.acquire()
+        threading.Timer(0.05, limiter.release).start()
+        self.assertTrue(limiter.acquire())
+        self.assertEqual((limiter.active, limiter.waiting), (1, 0))
+
+    def test_queue_is_bounded_and_times_out(self):
+        limiter = InFlightLimiter(1, queue=1, timeout=0.01)
+        limiter.acquire()
+        self.assertFalse(limiter.acquire())
+        # Callers queueing on their own are admitted into the queue slots.
+        self.assertTrue(limiter.acquire(wait=False))
+        self.assertFalse(limiter.acquire(wait=False))
+
+    def test_slots_are_shared_by_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        limiter = SlotLimiter(directory.name, 1, queue=1, timeout=0.01)
+        # Another worker holds the only slot until it dies.
+        worker = subprocess.Popen([sys.executable, '-c',
+            'import fcntl, sys, time\n'
+            f'f = open({str(Path(directory.name, "active-0"))!r}, "w")\n'
+            'fcntl.flock(f, fcntl.LOCK_EX)\n'
+            'print("held", flush=True)\n'
+            'time.sleep(60)'], stdout=subprocess.PIPE, text=True)
+        self.addCleanup(worker.kill)
+        self.assertEqual(worker.stdout.readline(), 'held\n')
+        self.assertFalse(limiter.acquire())
+        self.assertTrue(limiter.acquire(wait=False))
+        self.assertFalse(limiter.acquire(wait=False))
+        limiter.release()
+        worker.kill()
+        worker.wait()
+        worker.stdout.close()
+        self.assertTrue(limiter.acquire())
+        limiter.release()
+        self.assertEqual(limiter.held, [])
+
+    def test_slots_are_opened_once_and_polled_with_backoff(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        limiter = SlotLimiter(directory.name, 1, queue=1, timeout=0.2)
+        with mock.patch.object(backpressure.os, 'open',
+                wraps=os.open) as opened:
+            self.assertTrue(limiter.acquire())
+            # Threads share the descriptors, the slot is still taken.
+            with mock.patch.object(backpressure.fcntl, 'flock',
+                    wraps=backpressure.fcntl.flock) as flock:
+                self.assertFalse(limiter.acquire())
+            # 5 ms polls would have taken the slot lock 40 times.
+            self.assertLess(flock.call_count, 20)
+            limiter.release()
+            for _ in range(3):
+                self.assertTrue(limiter.acquire())
+                limiter.release()
+        self.assertEqual(opened.call_count, 2)
+
+
+class CheckInTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalog.types.clear()
+        self.addCleanup(catalog.types.clear)
+        self.client.force_login(get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+
+    def ingest(self, *payloads):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket.upsert_evand(payloads)
+
+    def test_lookup_by_ticket_id_and_mobile(self):
+        self.ingest(evand_payload('1'), evand_payload('2'))
+        response = self.client.get(reverse('checkin-lookup'),
+            {'ticket_id': '1'})
+        ticket, = response.json()['tickets']
+        self.assertEqual((ticket['ticket_id'], ticket['event_id'],
+            ticket['type'], ticket['checked_in_at']), ('1', '42', 'normal',
+            None))
+        response = self.client.get(reverse('checkin-lookup'),
+            {'mobile': '09120000000'})
+        self.assertEqual([t['ticket_id'] for t in response.json()['tickets']],
+            ['1', '2'])
+        with self.assertNumQueries(0):
+            checkin.get_ticket('1')
+            checkin.find_by_mobile('09120000000')
+        self.assertEqual(self.client.get(reverse('checkin-lookup')).status_code,
+            400)
+
+    def test_ingest_invalidates_cached_lookups(self):
+        self.assertIsNone(checkin.get_ticket('1'))
+        self.ingest(evand_payload('1'))
+        self.assertIs(checkin.get_ticket('1')['canceled'], False)
+        self.ingest(evand_payload('1', **{
+            'data[canceled]': 'true',
+            'data[mobile]': '09121111111',
+            'data[updated_at]': '2022-05-12T20:00:00+04:30',
+        }))
+        self.assertIs(checkin.get_ticket('1')['canceled'], True)
+        self.assertEqual(checkin.find_by_mobile('09120000000'), [])
+        self.assertEqual(len(checkin.find_by_mobile('09121111111')), 1)
+
+    def test_check_in_is_recorded_once(self):
+        self.ingest(evand_payload('1'), evand_payload('2', **{
+            'data[canceled]': 'true'}))
+        checkin.get_ticket('1')
+        url = reverse('check-in', args=['1'])
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], checkin.CHECKED_IN)
+        self.assertIsNotNone(checkin.get_ticket('1')['checked_in_at'])
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'],
+            checkin.ALREADY_CHECKED_IN)
+        self.assertEqual(self.client.post(
+            reverse('check-in', args=['2'])).json()['status'], checkin.CANCELED)
+        self.assertEqual(self.client.post(
+            reverse('check-in', args=['3'])).status_code, 404)
+
+        # Later payloads of the ticket keep the check-in.
+        self.ingest(evand_payload('1', **{
+            'data[updated_at]': '2022-05-12T20:00:00+04:30'}))
+        self.assertIsNotNone(Ticket.objects.get(ticket_id='1').checked_in_at)
+
+    @override_settings(CHECKIN_TOKEN='door-secret')
+    def test_door_token(self):
+        self.ingest(evand_payload('1'))
+        checkin.get_ticket('1')
+        client = Client(HTTP_AUTHORIZATION='Bearer door-secret')
+        with self.assertNumQueries(0):
+            response = client.get(reverse('checkin-lookup'),
+                {'ticket_id': '1'})
+        self.assertEqual(len(response.json()['tickets']), 1)
+        self.assertEqual(client.post(reverse('check-in', args=['1']))
+            .status_code, 200)
+        # Only the check-in views.
+        self.assertEqual(client.get(reverse('event-stats', args=['42']))
+            .status_code, 403)
+        self.assertEqual(Client(HTTP_AUTHORIZATION='Bearer wrong').get(
+            reverse('checkin-lookup'), {'ticket_id': '1'}).status_code, 401)
+
+    def test_sync_offline_scans(self):
+        self.ingest(evand_payload('1'), evand_payload('2'),
+            evand_payload('3', **{'data[canceled]': 'true'}))
+        self.client.post(reverse('check-in', args=['2']))
+        checkin.get_ticket('1')
+        scans = [
+            {'ticket_id': '1', 'scanned_at': '2022-05-13T10:05:00Z',
+                'device': 'door-b'},
+            {'ticket_id': '1', 'scanned_at': '2022-05-13T10:00:00Z',
+                'device': 'door-a'},
+            # Scanned before the online check-in at the other door.
+            {'ticket_id': '2', 'scanned_at': '2022-05-13T09:00:00Z'},
+            {'ticket_id': '3', 'scanned_at': '2022-05-13T10:00:00Z'},
+            {'ticket_id': '4', 'scanned_at': '2022-05-13T10:00:00Z'},
+            {'ticket_id': '1', 'scanned_at': 'yesterday'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('checkin-sync'), scans,
+                content_type='application/json')
+        self.assertEqual([result['status']
+            for result in response.json()['results']], [
+            checkin.ALREADY_CHECKED_IN, checkin.CHECKED_IN,
+            checkin.CHECKED_IN, checkin.CANCELED, checkin.NOT_FOUND,
+            checkin.INVALID])
+        ticket = checkin.get_ticket('1')
+        self.assertEqual((ticket['checked_in_at'].isoformat(),
+            ticket['checked_in_device']),
+            ('2022-05-13T10:00:00+00:00', 'door-a'))
+        self.assertEqual(checkin.get_ticket('2')['checked_in_at'].hour, 9)
+
+        # Syncing again changes nothing, whatever the order.
+        with self.assertNumQueries(3):
+            results = checkin.sync(scans[::-1])
+        self.assertNotIn(checkin.CHECKED_IN, [status for status, _ in results])
+        self.assertEqual(self.client.post(reverse('checkin-sync'),
+            {'ticket_id': '1'}, content_type='application/json')
+            .status_code, 400)
+
+
+class WebhookBatchTests(TestCase):
+
+    def setUp(self):
+        dedup.recent.clear()
+
+    def post(self, body, content_type='application/json'):
+        return self.client.post(reverse('webhook-batch'), body,
+            content_type=content_type)
+
+    def test_json_array(self):
+        # Delivered one by one before.
+        self.client.post(reverse('webhook'), evand_payload('1'))
+        payloads = [evand_payload('1'), evand_payload('2'),
+            evand_payload('3', **{'data[ticket][data][event_id]': ['4', '2']}),
+            evand_payload('2'), 'not an object']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(payloads)
+        self.assertEqual(len([query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT')
+            and '"core_webhookmessage"' in query['sql']]), 1)
+        self.assertEqual([result['status']
+            for result in response.json()['results']], [
+            'duplicate', 'processed', 'processed', 'duplicate', 'invalid'])
+        self.assertEqual(WebHookMessage.objects.count(), 3)
+        self.assertEqual(
+            sorted(Ticket.objects.values_list('ticket_id', flat=True)),
+            ['1', '2', '3'])
+        self.assertEqual(self.post('[{').status_code, 400)
+
+    def test_json_lines_in_chunks(self):
+        lines = [json.dumps(evand_payload(str(i))) for i in range(5)]
+        lines.insert(2, '{not json')
+        with override_settings(WEBHOOK_BATCH_CHUNK_SIZE=2):
+            response = self.post('\n'.join(lines) + '\n',
+                'application/x-ndjson')
+        self.assertEqual([result['status']
+            for result in response.json()['results']],
+            ['processed'] * 2 + ['invalid'] + ['processed'] * 3)
+        self.assertEqual(Ticket.objects.count(), 5)
+
+    def test_typed_json(self):
+        nested = evaluate_evand_fucking_data(evand_payload('1'))
+        nested['data'].update(canceled=True, discount_id=None)
+        nested['data']['ticket']['data'].update(price=150000,
+            available_count=10.0)
+        result, = self.post([nested]).json()['results']
+        self.assertEqual(result, {'status': 'processed'})
+        ticket = Ticket.objects.get()
+        self.assertEqual((ticket.price, ticket.available_count,
+            ticket.canceled, ticket.discount_id), (150000, 10, True, None))
+
+    @override_settings(WEBHOOK_INGEST_MODE='queue')
+    def test_queue_mode(self):
+        response = self.post([evand_payload('1'), evand_payload('2')])
+        self.assertEqual([result['status']
+            for result in response.json()['results']], ['pending'] * 2)
+        self.assertFalse(Ticket.objects.exists())
+        self.assertEqual(drain(), (2, 0))
+
+    def test_unparsable_payload_is_retried(self):
+        payload = evand_payload('1', **{'data[updated_at]': 'yesterday'})
+        result, = self.post([payload]).json()['results']
+        self.assertEqual(result['status'], 'pending')
+        self.assertIn('yesterday', result['error'])
+        message = WebHookMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertIsNotNone(message.next_attempt_at)
+
+    def test_failed_chunk_is_not_stored(self):
+        with mock.patch('core.hook.process_new_messages',
+                side_effect=RuntimeError):
+            response = self.post([evand_payload('1')])
+        self.assertEqual(response.json()['results'], [{'status': 'error'}])
+        self.assertFalse(WebHookMessage.objects.exists())
+        # Nor remembered as received.
+        self.assertEqual(self.post([evand_payload('1')]).json()['results'],
+            [{'status': 'processed'}])
+
+
+class DatabaseSettingsTests(TestCase):
+
+    def test_sqlite_urls(self):
+        self.assertEqual(database_from_url('sqlite://')['NAME'],
+            BASE_DIR / 'db.sqlite3')
+        self.assertEqual(database_from_url('sqlite:///data/db.sqlite3')
+            ['NAME'], BASE_DIR / 'data' / 'db.sqlite3')
+        self.assertEqual(database_from_url('sqlite:////var/lib/db.sqlite3')
+            ['NAME'], Path('/var/lib/db.sqlite3'))
+        self.assertEqual(database_from_url('sqlite:///:memory:')['NAME'],
+            ':memory:')
+
+    def test_postgres_url(self):
+        database = database_from_url('postgres://event%40app:p%3Ass@db:6543/'
+            'event%20app?sslmode=require')
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(
+            {key: database[key] for key in ('NAME', 'USER', 'PASSWORD',
+                'HOST', 'PORT', 'OPTIONS')},
+            {'NAME': 'event app', 'USER': 'event@app', 'PASSWORD': 'p:ss',
+                'HOST': 'db', 'PORT': 6543,
+                'OPTIONS': {'sslmode': 'require'}})
+        with self.assertRaises(ImproperlyConfigured):
+            database_from_url('mysql://db/eventapp')
+
+    def test_sqlite_pragmas_are_applied(self):
+        with connection.cursor() as cursor:
+            values = {}
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {pragma}')
+                values[pragma] = cursor.fetchone()[0]
+        # synchronous reads back as a number, 1 is NORMAL.
+        self.assertEqual(values,
+            {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 20000})
+
+
+@override_settings(ROOT_URLCONF='EventApp.urls_ingest',
+    WEBHOOK_INGEST_MODE='queue')
+class IngestUrlsTests(TestCase):
+
+    def test_only_hook_and_metrics_are_served(self):
+        def names(patterns):
+            for pattern in patterns:
+                if hasattr(pattern, 'url_patterns'):
+                    yield from names(pattern.url_patterns)
+                else:
+                    yield pattern.name
+
+        self.assertEqual(
+            sorted(names(get_resolver('EventApp.urls_ingest').url_patterns)),
+            ['metrics', 'webhook', 'webhook-batch'])
+        # Same paths as the full site.
+        self.assertEqual(reverse('webhook'),
+            reverse('webhook', urlconf='EventApp.urls'))
+        self.assertEqual(self.client.post(reverse('webhook'),
+            evand_payload()).status_code, 200)
+        self.assertEqual(self.client.get('/admin/').status_code, 404)
@@ -1,10 +1,15 @@
-from os import environ, getenv
+from django.urls import path, re_path
 
-from django.urls import path
+from . import urls_ingest
+from .views import check_in, checkin_lookup, checkin_sync, event_stats, \
+    export_tickets
 
-from .views import webhook
 
-
-urlpatterns = [
-    path(f'hook_{getenv("HOOK_UUID")}', webhook, name='webhook'),
+urlpatterns = urls_ingest.urlpatterns + [
+    path('events/<str:event_id>/stats', event_stats, name='event-stats'),
+    re_path(r'^tickets/export\.(?P<fmt>csv|jsonl)$', export_tickets,
+        name='export-tickets'),
+    path('checkin', checkin_lookup, name='checkin-lookup'),
+    path('tickets/<str:ticket_id>/checkin', check_in, name='check-in'),
+    path('checkin/sync', checkin_sync, name='checkin-sync'),
 ]
@@ -0,0 +1,16 @@
+from os import getenv
+
+from django.conf import settings
+from django.urls import path
+
+from .hook import async_webhook, metrics_view, webhook, webhook_batch
+
+
+urlpatterns = [
+    path(f'hook_{getenv("HOOK_UUID")}',
+        async_webhook if settings.WEBHOOK_VIEW == 'async' else webhook,
+        name='webhook'),
+    path(f'hook_{getenv("HOOK_UUID")}/batch', webhook_batch,
+        name='webhook-batch'),
+    path('metrics', metrics_view, name='metrics'),
+]
@@ -1,38 +1,136 @@
-from datetime import timedelta
-
-from django.db.transaction import atomic, non_atomic_requests
-from django.http import HttpResponse
-from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
-from django.utils import timezone
-
-from core.models import WebHookMessage, Ticket
-
-
-@csrf_exempt
-@require_POST
-@non_atomic_requests
-def webhook(request):
-    WebHookMessage.objects.filter(
-        received_at__lte=timezone.now() - timedelta(days=15)
-    ).delete()
-    try:
-        payload = request.POST.copy()
-        WebHookMessage.objects.create(
-            received_at=timezone.now(),
-            payload=payload,
-        )
-        process_webhook_payload(payload)
-    except Exception as e:
-        print('---------------error:')
-        print(str(e))
-        print(request.POST)
-    finally:
-        return HttpResponse("Message received okay.", content_type="text/plain")
-
-
-@atomic
-def process_webhook_payload(payload):
-    print(payload)
-    t = Ticket().from_evand(payload)
-    print(t)
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.utils.crypto import constant_time_compare
+from rest_framework.authentication import BaseAuthentication, \
+    BasicAuthentication, SessionAuthentication
+from rest_framework.decorators import api_view, authentication_classes, \
+    permission_classes
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, \
+    HTTP_404_NOT_FOUND, HTTP_409_CONFLICT
+
+from core import checkin
+from core.export import event_tickets, export_response
+from core.models import EventStats
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def event_stats(request, event_id):
+    '''Sales of an event per ticket type, read from EventStats.'''
+    types = list(EventStats.objects.filter(event_id=event_id).order_by(
+        'type').values('type', 'sold', 'canceled', 'revenue'))
+    return Response({
+        'event_id': event_id,
+        'sold': sum(t['sold'] for t in types),
+        'canceled': sum(t['canceled'] for t in types),
+        'revenue': sum(t['revenue'] for t in types),
+        'types': types,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_tickets(request, fmt):
+    '''
+    Stream the tickets of ``?event_id=`` (repeated or comma separated) as CSV
+    or JSON Lines, with Jalali dates when ``?jalali=1``.
+    '''
+    event_ids = [event_id
+        for value in request.query_params.getlist('event_id')
+        for event_id in value.split(',') if event_id]
+    if not event_ids:
+        return Response({'detail': 'event_id is required.'},
+            status=HTTP_400_BAD_REQUEST)
+    jalali = request.query_params.get('jalali', '').lower() in (
+        '1', 'true', 'yes')
+    return export_response(event_tickets(event_ids), fmt, jalali,
+        filename=f'tickets-{"-".join(event_ids)[:100]}')
+
+
+class DoorTokenAuthentication(BaseAuthentication):
+    '''
+    ``Authorization: Bearer <CHECKIN_TOKEN>`` of the door devices. Checked
+    before the session, so it costs no query.
+    '''
+    def authenticate(self, request):
+        token = settings.CHECKIN_TOKEN
+        header = request.headers.get('Authorization', '')
+        if not token or not header.startswith('Bearer '):
+            return None
+        if not constant_time_compare(header, f'Bearer {token}'):
+            raise AuthenticationFailed('Invalid check-in token.')
+        return AnonymousUser(), 'door'
+
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+
+class IsAdminOrDoor(IsAdminUser):
+    def has_permission(self, request, view):
+        return request.auth == 'door' or super().has_permission(request, view)
+
+
+CHECKIN_AUTHENTICATION = [DoorTokenAuthentication, SessionAuthentication,
+    BasicAuthentication]
+
+
+@api_view(['GET'])
+@authentication_classes(CHECKIN_AUTHENTICATION)
+@permission_classes([IsAdminOrDoor])
+def checkin_lookup(request):
+    '''Tickets of ``?ticket_id=`` or ``?mobile=``, read through the cache.'''
+    ticket_id = request.query_params.get('ticket_id')
+    mobile = request.query_params.get('mobile')
+    if ticket_id:
+        ticket = checkin.get_ticket(ticket_id)
+        tickets = [ticket] if ticket else []
+    elif mobile:
+        tickets = checkin.find_by_mobile(mobile)
+    else:
+        return Response({'detail': 'ticket_id or mobile is required.'},
+            status=HTTP_400_BAD_REQUEST)
+    return Response({'tickets': tickets})
+
+
+CHECKIN_STATUS = {
+    checkin.CHECKED_IN: HTTP_200_OK,
+    checkin.ALREADY_CHECKED_IN: HTTP_409_CONFLICT,
+    checkin.CANCELED: HTTP_409_CONFLICT,
+    checkin.NOT_FOUND: HTTP_404_NOT_FOUND,
+}
+
+
+@api_view(['POST'])
+@authentication_classes(CHECKIN_AUTHENTICATION)
+@permission_classes([IsAdminOrDoor])
+def check_in(request, ticket_id):
+    '''Check a ticket in, 409 when it already is or was canceled.'''
+    device = request.data.get('device') if isinstance(request.data,
+        dict) else None
+    status, ticket = checkin.check_in(ticket_id,
+        device=device if isinstance(device, str) else None)
+    return Response({'status': status, 'ticket': ticket},
+        status=CHECKIN_STATUS[status])
+
+
+@api_view(['POST'])
+@authentication_classes(CHECKIN_AUTHENTICATION)
+@permission_classes([IsAdminOrDoor])
+def checkin_sync(request):
+    '''
+    Apply a JSON array of ``{ticket_id, scanned_at, device}`` scans taken
+    offline, with a result per scan in the same order.
+    '''
+    scans = request.data
+    if not isinstance(scans, list):
+        return Response({'detail': 'Expected a list of scans.'},
+            status=HTTP_400_BAD_REQUEST)
+    if len(scans) > settings.CHECKIN_SYNC_MAX_SCANS:
+        return Response({'detail': 'At most '
+            f'{settings.CHECKIN_SYNC_MAX_SCANS} scans per request.'},
+            status=HTTP_400_BAD_REQUEST)
+    return Response({'results': [{'status': status, 'ticket': ticket}
+        for status, ticket in checkin.sync(scans)]})